@@ -0,0 +1,129 @@
+"""
+offline replay benchmark for game handlers, headless
+
+python -m capture.bench POEHandler recording.mp4
+python -m capture.bench POEHandler archive_dir/  # capture.record archive
+python -m capture.bench D2Handler frames_dir/ --skip 30 --limit 1000 --out bench.json
+"""
+import argparse
+import importlib
+import json
+import resource
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from capture.record import Playback
+from capture.utils import ctx
+
+
+HANDLERS = {
+    'POEHandler': 'capture.games.poe',
+    'D2Handler': 'capture.games.d2',
+}
+PERCENTILES = (50, 90, 99)
+
+
+def load_handler(name):
+    """POEHandler / D2Handler or module.path:ClassName"""
+    module, _, cls = name.rpartition(':')
+    if not module:
+        module, cls = HANDLERS[name], name
+    return getattr(importlib.import_module(module), cls)
+
+
+def iter_frames(source: Path, skip=0, limit=None):
+    """frames of a video file, a capture.record archive or a directory of png images"""
+    if Playback.is_archive(source):
+        playback = Playback(source)
+        end = len(playback) if limit is None else min(len(playback), skip + limit)
+        for idx in range(skip, end):
+            yield playback.frame(idx)
+        return
+
+    if source.is_dir():
+        for f in sorted(source.glob('*.png'))[skip:][:limit]:
+            yield cv2.imread(str(f))
+        return
+
+    cap = cv2.VideoCapture(str(source))
+    try:
+        count = 0
+        while cap.isOpened() and (limit is None or count < limit + skip):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            count += 1
+            if count > skip:
+                yield frame
+    finally:
+        cap.release()
+
+
+def summary_ms(values):
+    arr = np.asarray(values) * 1000
+    out = {'count': len(arr), 'mean': float(arr.mean()), 'max': float(arr.max())}
+    for p, v in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+        out[f'p{p}'] = float(v)
+    return out
+
+
+def run_bench(handler_cls, frames, fps=60):
+    latencies = []
+    detectors = defaultdict(list)
+
+    game = handler_cls()
+    with ctx.mock_all(fps):
+        ctx.c['headless'] = True
+        try:
+            started = time.perf_counter()
+            for frame in frames:
+                t = time.perf_counter()
+                game.frame(frame)
+                latencies.append(time.perf_counter() - t)
+                for name, spent in ctx.c['timings'].items():
+                    detectors[name].append(spent)
+            total = time.perf_counter() - started
+        finally:
+            ctx.c['headless'] = False
+            game.close()
+
+    if not latencies:
+        raise ValueError('No frames to replay')
+    return {
+        'handler': handler_cls.__name__,
+        'frames': len(latencies),
+        'fps': len(latencies) / total,
+        'latency_ms': summary_ms(latencies),
+        'detectors_ms': {name: summary_ms(v) for name, v in sorted(detectors.items())},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay frames through a game handler')
+    parser.add_argument('handler', help='POEHandler, D2Handler or module.path:ClassName')
+    parser.add_argument('source', type=Path, help='video, capture.record archive or png dir')
+    parser.add_argument('--skip', type=int, default=0, help='frames to skip at start')
+    parser.add_argument('--limit', type=int, default=None, help='max frames to replay')
+    parser.add_argument('--fps', type=int, default=60, help='mocked ctx.time() frame rate')
+    parser.add_argument('--out', type=Path, default=None, help='write json here, not stdout')
+    args = parser.parse_args(argv)
+
+    frames = iter_frames(args.source, args.skip, args.limit)
+    report = run_bench(load_handler(args.handler), frames, args.fps)
+    report['source'] = str(args.source)
+
+    data = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(data)
+    else:
+        sys.stdout.write(data + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,28 @@
+import contextvars
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, NamedTuple, Optional, Sequence, Set
 
 import numpy.typing as npt
 
-#from capture.ocr import run_ocr
-from capture.types import Img, Rect
+from capture.ocr import run_ocr
+from capture.types import Box, Img, Rect
+from capture.utils import ctx
 
 
-def crop(full: Img, pos: Rect, copy: bool = True):
+def crop(full: Img, pos: Box, copy: bool = True):
+    """
+    full can be a read-only BGRX capture view, only the cropped part is converted to BGR
+    """
     x0, x1 = pos[0], pos[2]
     y0, y1 = pos[1], pos[3]
-    img = full[y0:y1, x0:x1, :]
+    img = full[y0:y1, x0:x1, :3]
     if copy:
-        return img.copy()[:, :, :3]
-    return img[:, :, :3]
+        return img.copy()
+    return img
 
 
 def detect_text(img: Img, txt: str) -> Optional[Rect]:
@@ -30,7 +39,93 @@ def detect_text(img: Img, txt: str) -> Optional[Rect]:
                 return pos
 
 
+class Check(NamedTuple):
+    func: Callable
+    deps: Sequence[str] = ()
+    when: Optional[Callable[[dict], bool]] = None
+
+
+class DetectorGraph:
+    """
+    independent checks of a handler run concurrently on a thread pool
+    opencv and ocr release the GIL, so frame time is close to the slowest chain of checks
+
+    check runs after all its deps finished and `when(results)` is true
+    skipped checks have no result, checks depending on them see it missing
+    """
+
+    def __init__(self, workers=None):
+        self.checks = {}
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count())
+        self.lock = threading.Lock()
+        self.active: Set[int] = set()  # pool threads running a check
+
+    def add(self, name, func, deps=(), when=None):
+        """func(full) => result"""
+        self.checks[name] = Check(func, tuple(deps), when)
+        return self
+
+    def _timed(self, func, full):
+        ident = threading.get_ident()
+        with self.lock:
+            self.active.add(ident)
+        try:
+            t = time.time()
+            ret = func(full)
+            return ret, time.time() - t
+        finally:
+            with self.lock:
+                self.active.discard(ident)
+
+    def run(self, full: Img) -> dict:
+        results = {}
+        pending = dict(self.checks)
+        running = {}  # future => name
+
+        while pending or running:
+            blocked = set(pending) | set(running.values())
+            for name, check in list(pending.items()):
+                if blocked.intersection(check.deps):
+                    continue
+                del pending[name]
+                if check.when and not check.when(results):
+                    continue
+                task = contextvars.copy_context().run
+                running[self.executor.submit(task, self._timed, check.func, full)] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f'Unresolvable check deps: {list(pending)}')
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], spent = future.result()
+                ctx.add_timing(name, spent)
+        return results
+
+    def active_threads(self) -> Set[int]:
+        """pool threads running a check right now"""
+        with self.lock:
+            return set(self.active)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
 class Handler(ABC):
+    # (x0, y0, x1, y1) areas read by the handler, frames that don't change them are skipped
+    # empty: every frame is processed
+    regions: List[Box] = []
+
     @abstractmethod
     def frame(self, frame: npt.NDArray):
         raise NotImplementedError
+
+    def worker_threads(self) -> Set[int]:
+        """threads running checks for `frame` right now, sampled by the profiler"""
+        return set()
+
+    def close(self):
+        """release detector threads, the handler is not used after"""
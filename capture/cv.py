@@ -1,74 +1,302 @@
 import math
 import logging
 from pathlib import Path
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Union
 
 import cv2
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from capture.types import Img, Rect
 
 
 CONF_THRESHOLD_TM = 0.7  # cv2 template matching
+PYRAMID_LEVELS = 2  # x4 downscale for full screen lookups
+PYRAMID_CANDIDATES = 5  # coarse peaks refined at full resolution
+PYRAMID_MIN_SIZE = 8  # px, smallest downscaled template side
 log = logging.getLogger(__name__)
 
 
-def match_image(img: Img, template: Img, threshold: float = CONF_THRESHOLD_TM) -> Optional[Rect]:
+def as_img(template) -> Img:
+    """image of a capture.templates.Template handle, arrays are returned as is"""
+    return getattr(template, 'img', template)
+
+
+def match_template(img: Img, template: Img, mask: Optional[Img] = None) -> np.ndarray:
+    """
+    TM_CCOEFF_NORMED response, template alpha is used as mask unless given
+    masked score is nan on flat windows, those score 0
+    """
+    if mask is None:
+        mask = getattr(template, 'mask', None)
+    if mask is None:
+        return cv2.matchTemplate(img, as_img(template), cv2.TM_CCOEFF_NORMED)
+    res = cv2.matchTemplate(img, as_img(template), cv2.TM_CCOEFF_NORMED, mask=mask)
+    return np.nan_to_num(res, copy=False, nan=0, posinf=0, neginf=0)
+
+
+def match_image(
+    img: Img, template: Img, threshold: float = CONF_THRESHOLD_TM, pyramid: int = 0
+) -> Optional[Rect]:
+    """
+    template: image or capture.templates.Template
+    pyramid: downscale levels for coarse-to-fine search, 0 is exhaustive full resolution match
+    """
+    if pyramid:
+        return match_pyramid(img, template, threshold, pyramid)
     # can be: np.where(cv2.matchTemplate(cropped, PHANT, cv2.TM_CCOEFF_NORMED) > 0.77)
-    _, conf, _, coord = cv2.minMaxLoc(cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED))
+    _, conf, _, coord = cv2.minMaxLoc(match_template(img, template))
+    template = as_img(template)
     if conf > threshold:
         if len(coord) == 2:
-            return Rect(*coord, *template.shape[:2])
+            return Rect(*coord, template.shape[1], template.shape[0])
         return coord
 
 
-OVERLAP_THRESHOLD = 0.7
+def top_peaks(res: np.ndarray, count: int):
+    """(xs, ys) of the best local maxima of a matchTemplate response"""
+    peaks = res >= cv2.dilate(res, np.ones((3, 3), np.uint8))
+    ys, xs = np.nonzero(peaks)
+    if len(xs) > count:
+        best = np.argpartition(-res[ys, xs], count)[:count]
+        ys, xs = ys[best], xs[best]
+    return xs, ys
 
 
-class RectArray:
-    def __init__(self):
-        self.rects: List[Rect] = []
+def match_pyramid(
+    img: Img, template: Img, threshold: float = CONF_THRESHOLD_TM, levels: int = PYRAMID_LEVELS
+) -> Optional[Rect]:
+    """
+    match downscaled template on downscaled img, then refine the best candidates at full size
+    threshold applies to full resolution score, same as match_image
+    """
+    th, tw = template.shape[:2]
+    while levels and min(th, tw) >> levels < PYRAMID_MIN_SIZE:
+        levels -= 1
+    if not levels:
+        return match_image(img, template, threshold)
+
+    scale = 2**levels
+    small_img = cv2.resize(img, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+    if hasattr(template, 'pyramid'):
+        small_t, small_mask = template.pyramid(levels), template.pyramid_mask(levels)
+    else:
+        small_t = cv2.resize(
+            template, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA
+        )
+        small_mask = None
+    res = match_template(small_img, small_t, small_mask)
+
+    best_conf, best = threshold, None
+    margin = scale * 2
+    h, w = img.shape[:2]
+    for cx, cy in zip(*top_peaks(res, PYRAMID_CANDIDATES)):
+        x, y = int(cx) * scale, int(cy) * scale
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        x1, y1 = min(x + tw + margin, w), min(y + th + margin, h)
+        if x1 - x0 < tw or y1 - y0 < th:
+            continue
+        window = img[y0:y1, x0:x1]
+        _, conf, _, (dx, dy) = cv2.minMaxLoc(match_template(window, template))
+        if conf > best_conf:
+            best_conf, best = conf, Rect(x0 + dx, y0 + dy, tw, th)
+    return best
+
+
+PRIOR_MARGIN = 32  # px around the last match searched first
+PRIOR_MAX_MISSES = 3
 
-    def has_overlap(self, r: Rect, threshold) -> bool:
-        for er in self.rects:
-            overlap = er.overlap(r)
-            if overlap > threshold:
-                return True
-        return False
 
-    def append(self, r: Rect, overlap = OVERLAP_THRESHOLD):
-        if not self.has_overlap(r, overlap):
-            self.rects.append(r)
+def template_key(template: Img):
+    """Template handles have precomputed key"""
+    if key := getattr(template, 'key', None):
+        return key
+    return hash(template.data.tobytes())
 
-    def __iter__(self):
-        return iter(self.rects)
+
+class LocationPrior:
+    """
+    remembers where each template matched last and searches a small window there first
+    full frame search only on a miss, position forgotten after max_misses full frame misses
+    """
+
+    def __init__(self, margin=PRIOR_MARGIN, max_misses=PRIOR_MAX_MISSES):
+        self.margin = margin
+        self.max_misses = max_misses
+        self.last = {}  # template key => [Rect, misses]
+        self.hits = 0
+        self.misses = 0
+
+    def window(self, rect: Rect, shape):
+        x0, y0 = max(rect.x - self.margin, 0), max(rect.y - self.margin, 0)
+        x1 = min(rect.x + rect.w + self.margin, shape[1])
+        y1 = min(rect.y + rect.h + self.margin, shape[0])
+        return x0, y0, x1, y1
+
+    def match(
+        self,
+        img: Img,
+        template: Img,
+        threshold: float = CONF_THRESHOLD_TM,
+        pyramid: int = 0,
+        key=None,
+    ) -> Optional[Rect]:
+        key = template_key(template) if key is None else key
+        entry = self.last.get(key)
+        if entry:
+            x0, y0, x1, y1 = self.window(entry[0], img.shape)
+            if found := match_image(img[y0:y1, x0:x1], template, threshold):
+                self.hits += 1
+                found = Rect(found.x + x0, found.y + y0, found.w, found.h)
+                self.last[key] = [found, 0]
+                return found
+
+        self.misses += 1
+        found = match_image(img, template, threshold, pyramid)
+        if found:
+            self.last[key] = [found, 0]
+        elif entry:
+            entry[1] += 1
+            if entry[1] >= self.max_misses:
+                self.forget(key)
+        return found
+
+    def forget(self, key=None):
+        if key is None:
+            self.last.clear()
+        else:
+            self.last.pop(key, None)
+
+
+OVERLAP_THRESHOLD = 0.7
+MATCH_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4'), ('w', '<i4'), ('h', '<i4'), ('score', '<f4')])
+
+
+def nms(xs, ys, scores, w, h, overlap=OVERLAP_THRESHOLD) -> np.ndarray:
+    """
+    greedy non-maximum suppression of same-size boxes
+    one vectorized IoU pass per kept box, returns indexes of kept boxes by descending score
+    """
+    order = np.argsort(-scores, kind='stable')
+    xs, ys = xs[order], ys[order]
+    keep = []
+    idx = np.arange(len(order))
+    while idx.size:
+        best, rest = idx[0], idx[1:]
+        keep.append(order[best])
+        inter = np.clip(w - np.abs(xs[rest] - xs[best]), 0, None) * np.clip(
+            h - np.abs(ys[rest] - ys[best]), 0, None
+        )
+        iou = inter / (2 * w * h - inter)
+        idx = rest[iou <= overlap]
+    return np.array(keep, dtype=np.intp)
 
 
-def match_many(img: Img, template: Img, threshold: float = CONF_THRESHOLD_TM) -> RectArray:
+def match_many(img: Img, template: Img, threshold: float = CONF_THRESHOLD_TM) -> np.recarray:
     """
     we get multiple matches in the order of similarity to the template
     we can get some overlapping detections
     we want to skip if some of them overlapping more than OVERLAP_THRESHOLD
+    returns MATCH_DTYPE records: x, y, w, h, score
     """
-    matches = RectArray()
-    res = cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED)
-    loc = np.where(res >= threshold)
-    w, h = template.shape[1], template.shape[0]
-    for pt in zip(*loc[::-1]):
-        matches.append(Rect(pt[0], pt[1], w, h))
+    res = match_template(img, template)
+    template = as_img(template)
+    # local maxima only, neighbours of a peak are the same match shifted by a pixel
+    peaks = (res >= threshold) & (res >= cv2.dilate(res, np.ones((3, 3), np.uint8)))
+    ys, xs = np.nonzero(peaks)
+    scores = res[ys, xs]
+    h, w = template.shape[:2]
+    keep = nms(xs, ys, scores, w, h)
+
+    matches = np.recarray(len(keep), dtype=MATCH_DTYPE)
+    matches.x, matches.y = xs[keep], ys[keep]
+    matches.w, matches.h = w, h
+    matches.score = scores[keep]
     return matches
 
 
-def merge_multi(*images: List[Img]) -> Img:
-    """merge multiple images into one. for one-pass ocr"""
+# window elements for one vectorized TemplateBank pass, larger groups use cv2.matchTemplate:
+# the stacked product is only faster for small regions, ~2**17 elements is the break-even point
+MAX_BATCH_SIZE = 2**16
+
+
+class TemplateBank:
+    """
+    templates preloaded once and scored against a region together
+    same-size templates are stacked: scoring is one matrix product instead of N matchTemplate
+    scores are the same as cv2.TM_CCOEFF_NORMED
+    """
+
+    def __init__(self, templates=()):
+        self.groups = {}  # shape => [labels, templates, stacked normalized templates]
+        items = templates.items() if isinstance(templates, dict) else templates
+        for label, template in items:
+            self.add(label, template)
+
+    def add(self, label, template: Img):
+        template = as_img(template)[:, :, :3]
+        group = self.groups.setdefault(template.shape, [[], [], None])
+        group[0].append(label)
+        group[1].append(template)
+
+        # zero mean per channel and unit norm, so the dot product with a window is the score
+        t = template.reshape(-1, 3).astype(np.float32)
+        t -= t.mean(axis=0)
+        t /= max(float(np.linalg.norm(t)), 1e-6)
+        t = t.reshape(1, -1)
+        group[2] = t if group[2] is None else np.vstack([group[2], t])
+
+    def __len__(self):
+        return sum(len(g[0]) for g in self.groups.values())
+
+    def _group_scores(self, img: Img, shape, group) -> np.ndarray:
+        """max score of every template in the group over all positions"""
+        labels, templates, stacked = group
+        h, w, c = shape
+        positions = (img.shape[0] - h + 1) * (img.shape[1] - w + 1)
+
+        if positions * h * w * c > MAX_BATCH_SIZE:
+            return np.array(
+                [
+                    cv2.minMaxLoc(cv2.matchTemplate(img, t, cv2.TM_CCOEFF_NORMED))[1]
+                    for t in templates
+                ]
+            )
+
+        windows = sliding_window_view(img, shape).reshape(positions, h * w, c).astype(np.float32)
+        sums = windows.sum(axis=1)
+        sq_sums = np.square(windows).sum(axis=(1, 2))
+        # norm of the window with per-channel mean removed
+        norms = np.sqrt(np.maximum(sq_sums - np.square(sums).sum(axis=1) / (h * w), 0))
+        scores = windows.reshape(positions, -1) @ stacked.T
+        scores /= np.maximum(norms, 1e-6)[:, None]
+        return np.clip(scores.max(axis=0), -1, 1)
+
+    def scores(self, img: Img) -> list:
+        """[(label, confidence), ...] for templates that fit into img"""
+        img = img[:, :, :3]
+        out = []
+        for shape, group in self.groups.items():
+            if shape[0] > img.shape[0] or shape[1] > img.shape[1]:
+                continue
+            out.extend(zip(group[0], self._group_scores(img, shape, group).tolist()))
+        return out
+
+    def best(self, img: Img):
+        """(label, confidence) of the best matching template, (None, 0.0) if none fits"""
+        return max(self.scores(img), key=lambda x: x[1], default=(None, 0.0))
+
+
+def merge_multi(*images: List[Img], gap: int = 0) -> Img:
+    """merge multiple images into one. for one-pass ocr. gap: empty rows between images"""
     width = max(x.shape[1] for x in images)
-    height = sum(x.shape[0] for x in images)
+    height = sum(x.shape[0] for x in images) + gap * (len(images) - 1)
     to_ocr = np.zeros((height, width, 3), np.uint8)
     curr_y = 0
     for i in images:
         y, x = i.shape[:2]
-        to_ocr[curr_y : curr_y + y, 0:x, :] = i
-        curr_y += y
+        to_ocr[curr_y : curr_y + y, 0:x, :] = i[:, :, :3]
+        curr_y += y + gap
     return to_ocr
 
 
@@ -84,5 +312,49 @@ def put_text(img, txt, pos=(5, 20), color=(255, 0, 255), size=0.5):
             cv2.putText(img, s, text_pos, cv2.FONT_HERSHEY_SIMPLEX, size, color, 2)
 
 
+class DrawCmd(NamedTuple):
+    kind: str  # rect, text
+    pos: tuple  # rect: (x0, y0, x1, y1), text: (x, y)
+    text: Union[str, List[str], None]
+    color: tuple
+    size: float  # rect: thickness, text: font scale
+
+
+class DebugOverlay:
+    """
+    draw commands recorded during a frame, rasterized only when a debug consumer asks
+    plain DrawCmd tuples, so they can go to other consumers than cv2 (wayland overlay)
+    """
+
+    def __init__(self):
+        self.commands: List[DrawCmd] = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def rect(self, pos, color=(255, 0, 255), thickness=1):
+        self.commands.append(DrawCmd('rect', tuple(pos), None, color, thickness))
+
+    def text(self, txt, pos=(5, 20), color=(255, 0, 255), size=0.5):
+        self.commands.append(DrawCmd('text', tuple(pos), txt, color, size))
+
+    def label(self, pos, txt, color=(255, 0, 255)):
+        """rect with text above it"""
+        self.rect(pos, color)
+        self.text(txt, (pos[0], max(pos[1] - 5, 12)), color)
+
+    def draw(self, img: Img) -> Img:
+        for cmd in self.commands:
+            if cmd.kind == 'rect':
+                cv2.rectangle(img, cmd.pos[:2], cmd.pos[2:], cmd.color, cmd.size)
+            else:
+                put_text(img, cmd.text, cmd.pos, cmd.color, cmd.size)
+        return img
+
+    def render(self, img: Img) -> Img:
+        """BGR copy of img with the commands drawn"""
+        return self.draw(np.ascontiguousarray(img[:, :, :3]).copy())
+
+
 def imread(path: Path) -> Img:
     return cv2.imread(str(path))[:, :, :3]
@@ -7,13 +7,15 @@ import numpy as np
 
 from fan_tools.python import rel_path
 
-from capture.common import crop, detect_text, Handler
-from capture.cv import imread, match, put_text
-from capture.ocr import CONF_THRESHOLD, OCRArea, read_text, run_ocr
+from capture.common import crop, detect_text, DetectorGraph, Handler
+from capture.cv import imread, match_image, put_text, TemplateBank
+from capture.ocr import CONF_THRESHOLD, OCRArea, run_ocr
+from capture.templates import templates
 from capture.utils import ctx, dtime, spell, throttle
 
 
 T_DIR = rel_path('../../templates/d2')
+UNK_DIR = rel_path('../../.data/d2_potions')  # unknown cells, move into templates/d2/potions
 
 
 def split_coords(source, x_num, y_num=1):
@@ -58,11 +60,11 @@ class POT(enum.IntEnum):
 
 
 class Potions:
-    p_dir = T_DIR / 'potions'
-    p_dir.mkdir(parents=True, exist_ok=True)
+    # outside of templates/: writes there would invalidate the watched listing every frame
+    unk_dir = UNK_DIR
 
     coord = (1332, 1350, 1620, 1415)
-    data = []
+    bank = TemplateBank()
     pos = [None, None, None, None]
     kb = ['a', 's', 'd', 'f']
     have_read = []
@@ -75,14 +77,13 @@ class Potions:
                 return True
 
     def reread(self):
-        for f in self.p_dir.iterdir():
-            if f in self.have_read:
+        for t in templates.glob('d2/potions'):
+            if t.path in self.have_read:
                 continue
 
-            h = imread(f)
-            self.have_read.append(f)
+            self.have_read.append(t.path)
 
-            n = f.name
+            n = t.path.name
             if n.startswith('mana'):
                 _t = POT.MP
             elif n.startswith('hp'):
@@ -91,21 +92,23 @@ class Potions:
                 _t = POT.RV
             else:
                 continue
-            self.data.append((h, _t))
+            self.bank.add(_t, t)
 
     def detect(self, img, cropped):
         # cv2.imshow('I', img)
         # cv2.imshow('C', cropped)
 
-        for template, _type in self.data:
-            if match(img, template, 0.93):
-                # print(f'Ret type: {_type}')
-                return _type
+        _type, conf = self.bank.best(img)
+        if conf > 0.93:
+            # print(f'Ret type: {_type}')
+            return _type
 
-        cv2.imwrite(str(self.p_dir / 'a_unk.png'), cropped)
+        self.unk_dir.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(self.unk_dir / 'a_unk.png'), cropped)
 
     def frame(self, full):
-        cropped = crop(ctx.df, self.coord, copy=False)
+        self.reread()
+        cropped = crop(full, self.coord, copy=False)
         h, w = cropped.shape[:2]
         # cv2.rectangle(cropped, (0, 0), (w, h), (255, 255, 0), 2)
         self.rects(cropped)
@@ -122,11 +125,10 @@ class Potions:
 
             cell = crop(cropped, (x0, y0, x1, y1), copy=False)
             img = crop(cropped, (*start, *end))
-            self.reread()
             what = self.detect(cell, cropped=img)
 
             self.pos[idx] = what
-            ctx.d(f'{idx=} => {what}')
+            ctx.d('idx=%s => %s', idx, what)
 
             # h = hist(img)
             # ctx.d(f'Hist: {idx=} => {h}')
@@ -134,6 +136,8 @@ class Potions:
 
 
 class MPText(OCRArea):
+    recognize_only = True
+
     def __init__(self):
         super().__init__('d2_mana')
         self.pos = (1800, 1180, 2220, 1230)
@@ -145,12 +149,12 @@ class MPText(OCRArea):
             return None
         cropped = crop(full, self.pos, copy=False)
         mp = self.get_mana(cropped)
-        ctx.d(f'MP: {mp}')
+        ctx.d('MP: %s', mp)
         return mp
 
     def get_mana(self, img):
         with suppress(Exception):
-            data = read_text(img)
+            data = [d[1] for d in self.ocr(img)]
             data = ' / '.join(data).lower()
             ctx.d(f'O: {data}')
             data = data.split('ana:')[1].replace('/ 1 /', '/')
@@ -160,12 +164,13 @@ class MPText(OCRArea):
                 return int(data[0]) / int(data[1])
 
 
-C_BUTTON = imread(T_DIR / 'close_btn.png')
+C_BUTTON = templates['d2/close_btn.png']
+INV_POS = (1320, 1070, 1400, 1170)
 
 
-def is_inventory(full, inv_pos=(1320, 1070, 1400, 1170)):
+def is_inventory(full, inv_pos=INV_POS):
     cropped = crop(full, inv_pos)
-    return match(cropped, C_BUTTON)
+    return match_image(cropped, C_BUTTON)
 
 
 class MP:
@@ -204,8 +209,8 @@ class MP:
     def frame(self, full):
         # self.smask(full)
         # self.smask2(full)
-        # cv2.rectangle(ctx.df, self.pos[:2], self.pos[2:], (255, 0, 255), 2)
-        # cv2.imshow('debug', ctx.df)
+        # ctx.overlay.rect(self.pos, (255, 0, 255), 2)
+        # ctx.show('debug', ctx.render())
         if self.sample is None:
             curr_m = self.mp.frame(full)
             if curr_m and curr_m == 1:
@@ -229,7 +234,7 @@ class MP:
         # idx = np.nonzero(cropped == [88, 0, 0])[0][0]
         y = cropped.shape[0]
         pct = float((y - idx) / y)
-        ctx.d(f'Curr MP: {pct:.2}  => {idx}')
+        ctx.d('Curr MP: %.2f  => %s', pct, idx)
 
 
 class D2Handler(Handler):
@@ -239,26 +244,47 @@ class D2Handler(Handler):
         self.mp = MP()
         ctx.reset()
 
+        self.detectors = (
+            DetectorGraph()
+            .add('game', self.is_game)
+            .add('potions', self.potions.frame, deps=['game'], when=self.in_game)
+            .add('mp', self.mp.frame, deps=['game'], when=self.in_game)
+        )
+
     g_pos = (2150, 1300, 2200, 1400)
-    g_tmpl = imread(T_DIR / 'game.png')
+    g_tmpl = templates['d2/game.png']
+
+    @property
+    def regions(self):
+        return [self.g_pos, Potions.coord, MP.pos, self.mp.mp.pos, INV_POS]
+
+    @staticmethod
+    def in_game(res):
+        return bool(res.get('game'))
 
     def is_game(self, full):
-        return match(crop(full, self.g_pos, copy=True), self.g_tmpl)
+        return match_image(crop(full, self.g_pos, copy=True), self.g_tmpl)
 
     def frame(self, full):
         ctx.frame(full)
-        if not self.is_game(full):
+        res = self.detectors.run(full)
+        if not res['game']:
             ctx.d('No game')
             return
-        self.potions.frame(full)
 
-        curr_m = self.mp.frame(full)
+        curr_m = res['mp']
         if curr_m:
-            ctx.d(f'CurrM: {curr_m:.2}')
+            ctx.d('CurrM: %.2f', curr_m)
             if curr_m < 0.35:  # currently something off
                 self.potions.mana()
 
-        ctx.d(f'Frame: {ctx.f_count}')
+        ctx.d('Frame: %s', ctx.f_count)
 
     def handle_key(self, char):
         pass
+
+    def worker_threads(self):
+        return self.detectors.active_threads()
+
+    def close(self):
+        self.detectors.close()
@@ -3,17 +3,13 @@ from contextlib import suppress
 import cv2
 import numpy as np
 
-from fan_tools.python import rel_path
-
-from capture.common import crop, detect_text, Handler
-from capture.cv import imread, put_text
-from capture.ocr import CONF_THRESHOLD, OCRArea, read_text
+from capture.common import crop, detect_text, DetectorGraph, Handler
+from capture.cv import match_image, put_text, TemplateBank
+from capture.ocr import CONF_THRESHOLD, DIGITS, FRACTION, OCRArea, read_text
+from capture.templates import templates
 from capture.utils import ctx, dtime, spell, throttle
 
 
-T_DIR = rel_path('../../templates/poe')
-
-
 @throttle(3.0)
 def convocation():
     return ctx.gui.hotkey('w')  # convoc
@@ -67,20 +63,37 @@ class POEHandler(Handler):
         ctx.reset()
         self.d_or_s = True
 
+        spell_deps = ('right_ok', 'chat', 'battle_loc')
+        self.detectors = (
+            DetectorGraph()
+            .add('right_ok', is_right_ok)
+            .add('chat', is_chat)
+            .add('battle_loc', battle_loc)
+            .add('life', self.life.frame, deps=spell_deps, when=spell_allowed)
+            .add('phantasms', phantasms_count, deps=spell_deps, when=spell_allowed)
+        )
+
+    @property
+    def regions(self):
+        fixed = [BUFFS_POS, CHAT_POS, CHAT_UP_POS, BATTLE_LOC_POS]
+        return fixed + [area.pos for area in (self.life, self.mana) if area.pos]
+
     def frame(self, full):
         ctx.frame(full)
-        ctx.d(f'Frame: {ctx.f_count}')
+        ctx.d('Frame: %s', ctx.f_count)
 
-        if not can_spell(full):
+        res = self.detectors.run(full)
+        if not spell_allowed(res):
             ctx.d('Cannot use spell')
             return
 
-        last = self.life.frame(full)
-        if last is not None:
-            cv2.imshow('LIFE', last)
+        data = self.use_life(res['life'])
+        ctx.d('Life: %s', data)
+        if self.life.last_img is not None:
+            put_text(self.life.last_img, data)
+            ctx.show('LIFE', self.life.last_img)
 
-        p_count = phantasms_count(full)
-        if p_count < 10:
+        if res['phantasms'] < 10:
             if self.d_or_s:
                 if dessecrate():
                     self.d_or_s = False
@@ -88,15 +101,45 @@ class POEHandler(Handler):
                 if offering():
                     self.d_or_s = True
 
+    def use_life(self, life):
+        """taps by life percent, input is sent from the capture thread only"""
+        if life is None:
+            return 'ERR'
+        curr, total = life
+        if not curr:
+            return 'DEAD'
+        perc = curr / total
+        if perc < 0.49:
+            instant_life_tap()
+            return f'TAP: {curr} / {perc=}'
+        if perc < 0.73:
+            long_life_tap()
+            reaper()
+            return f'LTAP: {perc=}'
+        if perc < 0.99:
+            convocation()
+            summon()
+        return f'NP: {curr} / {perc=}'
+
     def handle_key(self, char):
         pass
 
+    def worker_threads(self):
+        return self.detectors.active_threads()
+
+    def close(self):
+        self.detectors.close()
+
 
 class LifeFragment(OCRArea):
     """
     pos: [130, 1083, 264, 1119]
     """
 
+    recognize_only = True
+    allowlist = DIGITS
+    pattern = FRACTION
+
     def __init__(self):
         super().__init__('life')
         self.prev = None
@@ -131,51 +174,38 @@ class LifeFragment(OCRArea):
         # out = cv2.GaussianBlur(out, (3, 3), cv2.BORDER_DEFAULT)
         return out
 
+    def prepare(self, img):
+        return self.keep_bw(img)
+
     def frame(self, full):
+        """(curr, total) or None, runs on a detector thread: no input here, see use_life"""
         self.prev = None
 
-        img = crop(full, self.pos or [0, 0, 150, 150])
-        img = self.keep_bw(img)
-
-        self.last_img = img.copy()
+        # copy: the prepared crop is shared through the frame cache, text is drawn on it later
+        img = ctx.derive(full, self.pos or [0, 0, 150, 150], self.name, self.prepare).copy()
+        self.last_img = img
 
         if not self.pos:
             ctx.d('wait init')
             put_text(img, 'wait init')
             return
 
-        data = 'ERR'
         try:
-            curr, total = self.get_life(img)
-            perc = curr / total
-            self.prev = (curr, total)
-            if not curr:
-                data = 'DEAD'
-            elif perc < 0.49:
-                instant_life_tap()
-                data = f'TAP: {curr} / {perc=}'
-            elif perc < 0.73:
-                long_life_tap()
-                reaper()
-                data = f'LTAP: {perc=}'
-            elif perc < 0.99:
-                convocation()
-                summon()
-                data = f'NP: {curr} / {perc=}'
-            else:
-                data = f'NP: {curr} / {perc=}'
-            ctx.d(f'Life: {data}')
+            life = self.get_life(img)
         except Exception as e:
             err = f'{e=} {self.ls=}'
             ctx.d(err)
             if err != self.prev_err:
                 print(err, flush=True)
                 self.prev_err = err
-        put_text(img, data)
-        return img
+            return
+        if life and life[1]:
+            self.prev = life
+        return self.prev
 
     @dtime('life with ocr =>')
     def get_life(self, img: np.ndarray):
+        """recognizer only with DIGITS, cached on this crop alone"""
         life_string, conf = self.ocr_one(img)
         self.conf = (self.conf * self.frames + conf) / (self.frames + 1)
         # print(f'{self.conf=} {self.frames=} {conf=}')
@@ -197,6 +227,9 @@ class LifeFragment(OCRArea):
 
 class ManaFragment(OCRArea):
     active_delay = 1.3
+    recognize_only = True
+    allowlist = DIGITS
+    pattern = FRACTION
 
     def __init__(self):
         super().__init__('mana')
@@ -261,13 +294,14 @@ class ManaFragment(OCRArea):
         self.add_regen(reaper())
 
 
-PHANT = imread(T_DIR / 'phant.png')
+BUFFS_POS = (0, 0, 700, 125)
+PHANT = templates['poe/phant.png']
 
 
 def get_phantasms(f):
-    cropped = crop(f, (0, 0, 700, 125), copy=False)
-    if coord := match(cropped, PHANT):
-        x0, y0 = coord
+    cropped = ctx.derive(f, BUFFS_POS)
+    if coord := match_image(cropped, PHANT):
+        x0, y0 = coord.x, coord.y
         dy, dx = PHANT.shape[:2]
         return crop(cropped, (x0, y0, x0 + dx, y0 + dy + 23), copy=False)
 
@@ -276,55 +310,56 @@ def phantasms_count(f):
     return find_num((get_phantasms(f)))
 
 
-SKELS = imread(T_DIR / 'skels.png')
+SKELS = templates['poe/skels.png']
 
 
 def get_skels(f):
-    cropped = crop(f, (0, 0, 700, 125), copy=False)
-    if coord := match(cropped, SKELS):
-        x0, y0 = coord
+    cropped = ctx.derive(f, BUFFS_POS)
+    if coord := match_image(cropped, SKELS):
+        x0, y0 = coord.x, coord.y
         dy, dx = SKELS.shape[:2]
         return crop(cropped, (x0, y0, x0 + dx + 19, y0 + dy + 21), copy=False)
 
 
-CWALK = imread(T_DIR / 'cwalk.png')
+CWALK = templates['poe/cwalk.png']
 
 
 def is_cwalk(f):
-    cropped = crop(f, (0, 0, 700, 125), copy=False)
-    _, conf, _, coord = cv2.minMaxLoc(cv2.matchTemplate(cropped, CWALK, cv2.TM_CCOEFF_NORMED))
-
-    if conf > 0.7:
+    cropped = ctx.derive(f, BUFFS_POS)
+    if match_image(cropped, CWALK):
         return True
 
 
-CHAT = imread(T_DIR / 'chat.png')
+CHAT_POS = (140, 1035, 180, 1075)
+CHAT = templates['poe/chat.png']
 
 
 def is_chat(f):
-    cropped = crop(f, [140, 1035, 180, 1075], copy=False)
-    if match(cropped, CHAT):
+    cropped = crop(f, CHAT_POS, copy=False)
+    if match_image(cropped, CHAT):
         return True
     return False
 
 
-CHAT_UP_BTN = imread(T_DIR / 'chat_up_btn.png')
+CHAT_UP_POS = (0, 970, 25, 990)
+CHAT_UP_BTN = templates['poe/chat_up_btn.png']
 
 
 def is_right_ok(f):
-    cropped = crop(f, [0, 970, 25, 990], copy=False)
-    if match(cropped, CHAT_UP_BTN):
+    cropped = crop(f, CHAT_UP_POS, copy=False)
+    if match_image(cropped, CHAT_UP_BTN):
         return True
 
 
-@dtime('battle_loc => ')
+BATTLE_LOC_POS = (2200, 50, 2550, 130)
+
+
 def battle_loc(f):
     """
     1. not hideout
     2. has monster level
     """
-    cropped = crop(f, [2200, 50, 2550, 130], copy=False)
-    line = ' '.join(read_text(cropped)).lower()
+    line = ' '.join(read_text(ctx.derive(f, BATTLE_LOC_POS))).lower()
     if 'hideout' in line:
         return False
     if 'monster level' in line:
@@ -332,6 +367,11 @@ def battle_loc(f):
     return False
 
 
+def spell_allowed(res):
+    """can_spell from DetectorGraph results"""
+    return bool(res.get('right_ok')) and not res.get('chat') and bool(res.get('battle_loc'))
+
+
 @dtime('can_spell => ')
 def can_spell(f):
     """
@@ -352,22 +392,14 @@ def skels_count(f):
     return find_num((get_skels(f)))
 
 
-BUFF_NUMS = {}
-for i in range(2, 21):
-    BUFF_NUMS[i] = imread(T_DIR / f'buffs/{i}.png')
+BUFF_NUMS = TemplateBank((i, templates[f'poe/buffs/{i}.png']) for i in range(2, 21))
 
 
 def find_num(img):
-    candidate = 0
-    max_conf = 0
     if img is None:
         return 0
 
-    for i, mask in BUFF_NUMS.items():
-        _, conf, _, coord = cv2.minMaxLoc(cv2.matchTemplate(img, mask, cv2.TM_CCOEFF_NORMED))
-        if conf > max_conf:
-            candidate = i
-            max_conf = conf
-    if max_conf > 0.5:
+    candidate, conf = BUFF_NUMS.best(img)
+    if conf > 0.5:
         return candidate
     return 0
@@ -10,27 +10,23 @@ from uuid import uuid4
 import pyautogui
 import Xlib
 import Xlib.display
-from fan_tools.python import rel_path
 from system_hotkey import SystemHotkey
 
-from capture.common import crop
-from capture.cv import imread, match
+from capture.cv import match_image
+from capture.templates import templates
 from capture.types import Rect
 from capture.utils import ctx
 
 
-T_DIR = rel_path('../../templates/poe')
-
-
 hk = SystemHotkey()
 KB_NEW_INSTANCE = ('kp_next',)  # 3
 KB_WP_CLICK = ('kp_down',)  # 4
 KP_UP = ('kp_up',)  # 
 KP_END = ('kp_end',)  # 1
 KP_LEFT = ('kp_left',)  # 6
-WP_IMAGE = imread(T_DIR / 'wp.png')
-RESS_IMAGE = imread(T_DIR / 'ress.png')
-DEL_IMAGE = imread(T_DIR / 'delir.png')
+WP_IMAGE = templates['poe/wp.png']
+RESS_IMAGE = templates['poe/ress.png']
+DEL_IMAGE = templates['poe/delir.png']
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
 log = logging.getLogger('poe2')
@@ -64,9 +60,8 @@ def go_instance():
 
 def detect_delirium():
     log.info('check delirium')
-    screen = ctx.screenshot()
-    cropped = crop(screen, Rect(2200, 10, 2560, 380))
-    if match(cropped, DEL_IMAGE):
+    cropped = ctx.screenshot_regions({'delirium': Rect(2200, 10, 2560, 380)})['delirium']
+    if match_image(cropped, DEL_IMAGE):
         # play beep with pulseaudio
         run(['paplay', '/usr/share/sounds/freedesktop/stereo/complete.oga'])
         return True
@@ -77,7 +72,7 @@ def click_waypoint():
     screen = ctx.screenshot()
 
     # if need resurrect
-    if coord := match(screen, RESS_IMAGE):
+    if coord := match_image(screen, RESS_IMAGE):
         log.info('need resurrect')
         pyautogui.moveTo(coord.x + 15, coord.y + 10)
         time.sleep(0.03)
@@ -85,7 +80,7 @@ def click_waypoint():
         time.sleep(0.4)
         screen = ctx.screenshot()
 
-    if coord := match(screen, WP_IMAGE):
+    if coord := match_image(screen, WP_IMAGE):
         pyautogui.moveTo(coord.x + 6, coord.y + 2)
         time.sleep(0.03)
         pyautogui.click(coord.x + 6, coord.y + 2, duration=0.05)
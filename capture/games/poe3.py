@@ -1,14 +1,11 @@
 import logging
-import time
 from contextlib import contextmanager
 from subprocess import run
 
-from fan_tools.python import rel_path
-
-from capture.common import crop
-from capture.cv import imread, match_image
-from capture.types import Rect
-from capture.utils import ctx
+from capture.cv import PYRAMID_LEVELS, match_image
+from capture.input import MODIFIERS, get_backend
+from capture.templates import templates
+from capture.utils import Click, Hold, Release, Wait, ctx
 
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
@@ -18,56 +15,37 @@ for name in ['PIL.PngImagePlugin']:
     logging.getLogger(name).setLevel(logging.INFO)
 
 
-# Key codes from /usr/include/linux/input-event-codes.h
-KEY_LEFTCTRL = 29
-BTN_LEFT = 0x110
-WIDTH_LEFT = 2560 / 2
 ASHEN_COORD = (472, 651)
 NEW_INST_COORD = (666, 449)
+INSTANCE_WAIT = 3.0  # worst case instance load
+INSTANCE_POLL_HZ = 20  # full screen pyramid match per poll
+DELIRIUM_POS = (2200, 10, 2560, 380)  # top right, where the delirium mirror timer shows up
+RESURRECT_WAIT = 1.0
 
 
 def mousemove(x, y):
-    x_str = str(WIDTH_LEFT + x / 2)
-    y_str = str(y / 2)
-    log.info(f'Click to {x_str}, {y_str}')
-    run(['ydotool', 'mousemove', '-a', x_str, y_str])
+    log.info(f'Move to {x}, {y}')
+    get_backend().mousemove(x, y)
 
 
 def click(x=None, y=None, duration=None):
     """Click at position. If x,y provided, moves there first."""
-    if x is not None and y is not None:
-        mousemove(x, y)
-        if duration:
-            time.sleep(duration)
-
-    run(['ydotool', 'click', '0xC0'])  # 0xC0 is BTN_LEFT click
+    get_backend().click(x, y, duration)
 
 
 def press(key_code):
-    run(['ydotool', 'key', f'{key_code}:1'])
-    run(['ydotool', 'key', f'{key_code}:0'])
+    get_backend().tap(key_code)
 
 
 @contextmanager
 def hold(key):
-    key_map = {
-        'ctrl': KEY_LEFTCTRL,
-    }
-    key_code = key_map[key]
-
-    # Press key down
-    run(['ydotool', 'key', f'{key_code}:1'])
-    try:
+    with get_backend().hold(MODIFIERS[key]):
         yield
-    finally:
-        # Release key
-        run(['ydotool', 'key', f'{key_code}:0'])
 
 
-T_DIR = rel_path('../../templates/poe')
-WP_IMAGE = imread(T_DIR / 'wp.png')
-RESS_IMAGE = imread(T_DIR / 'ress.png')
-DEL_IMAGE = imread(T_DIR / 'delir.png')
+WP_IMAGE = templates['poe/wp.png']
+RESS_IMAGE = templates['poe/ress.png']
+DEL_IMAGE = templates['poe/delir.png']
 
 
 def go_instance():
@@ -75,52 +53,82 @@ def go_instance():
     if detect_delirium():
         return True
 
-    with hold('ctrl'):
-        # mousemove(1270, 640)
-        click_waypoint()
-        log.debug('clicked waypoint')
-        time.sleep(0.35)
-        click(*ASHEN_COORD, duration=0.1)
-        log.debug('clicked ashen')
-        time.sleep(0.45)
-        click(*NEW_INST_COORD, duration=0.1)
-        log.debug('clicked new instance')
-        time.sleep(0.1)
+    # runs on the scheduler thread, screen is watched while the macro plays
+    macro = ctx.actions.submit(
+        [
+            Hold('ctrl'),
+            *waypoint_actions(),
+            Wait(0.35),
+            Click(*ASHEN_COORD, duration=0.1),
+            Wait(0.45),
+            Click(*NEW_INST_COORD, duration=0.1),
+            Wait(0.1),
+            Release('ctrl'),
+        ],
+        cancel_if=delirium_visible,
+    )
+    if not macro.result():
+        log.info('delirium during instance macro')
+        beep()
+        return True
+
+    wait_instance()
+    return detect_delirium()
+
+
+def wait_instance():
+    """
+    waypoint hides on the loading screen and shows up next to the player in the new instance
+    timeout is the old fixed sleep
+    """
+    kw = dict(pyramid=PYRAMID_LEVELS, poll_hz=INSTANCE_POLL_HZ)
+    gone = ctx.wait_until_gone(WP_IMAGE, timeout=INSTANCE_WAIT, **kw)
+    loaded = ctx.wait_for(WP_IMAGE, timeout=max(0.0, INSTANCE_WAIT - gone.elapsed), **kw)
+    log.info(f'instance loaded: {bool(loaded)} in {gone.elapsed + loaded.elapsed:.2f}s')
+    return loaded
+
 
-    time.sleep(3.0)
-    detect_delirium()
+def beep():
+    # play beep with pulseaudio
+    run(['paplay', '/usr/share/sounds/freedesktop/stereo/complete.oga'])
+
+
+def delirium_visible():
+    """macro guard, polled often: region capture only and no side effects"""
+    cropped = ctx.screenshot_regions({'delirium': DELIRIUM_POS})['delirium']
+    return bool(match_image(cropped, DEL_IMAGE))
 
 
 def detect_delirium():
     log.info('check delirium')
-    cropped = screen = ctx.screenshot()
-    # cropped = crop(screen, Rect(2200, 10, 2560, 380))
-    if match_image(cropped, DEL_IMAGE):
-        # play beep with pulseaudio
-        run(['paplay', '/usr/share/sounds/freedesktop/stereo/complete.oga'])
+    if delirium_visible():
+        beep()
         return True
 
 
-def click_waypoint():
+def waypoint_actions():
+    """resurrect right away if needed, then actions to click waypoint"""
     log.info('click waypoint')
-    screen = ctx.screenshot()
+    screen = ctx.grab()  # BGR, same as the wait_until_gone region below
 
     # if need resurrect
-    if coord := match_image(screen, RESS_IMAGE):
+    if coord := ctx.detect(RESS_IMAGE, PYRAMID_LEVELS, remember=True, img=screen):
         log.info('need resurrect')
-        mousemove(coord.x + 15, coord.y + 10)
-        time.sleep(0.03)
-        click()
-        time.sleep(0.3)
-        screen = ctx.screenshot()
+        ctx.actions.submit([Click(coord.x + 15, coord.y + 10, duration=0.03)]).result()
+        region = coord.box(pad=20, shape=screen.shape)
+        gone = ctx.wait_until_gone(RESS_IMAGE, region, timeout=RESURRECT_WAIT)
+        log.debug(f'resurrect button gone: {bool(gone)} in {gone.elapsed:.2f}s')
+        screen = ctx.grab()
 
-    if coord := match_image(screen, WP_IMAGE):
+    if coord := ctx.detect(WP_IMAGE, PYRAMID_LEVELS, remember=True, img=screen):
         log.info(f'Got waypoing: {coord}')
-        mousemove(coord.x + 6, coord.y + 2)
-        time.sleep(0.03)
-        click(coord.x + 6, coord.y + 2, duration=0.05)
-    else:
-        log.info('no wp found')
+        return [Click(coord.x + 6, coord.y + 2, duration=0.05)]
+    log.info('no wp found')
+    return []
+
+
+def click_waypoint():
+    return ctx.actions.submit(waypoint_actions()).result()
 
 
 def main():
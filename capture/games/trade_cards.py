@@ -2,9 +2,7 @@
 import logging
 import time
 
-from fan_tools.python import rel_path
-
-from capture.cv import imread
+from capture.templates import templates
 from capture.utils import ctx
 
 
@@ -12,11 +10,10 @@ logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(levelname)s] %(n
 log = logging.getLogger('trade_cards')
 
 
-T_DIR = rel_path('../../templates/poe')
-DIVINATION_CARD = imread(T_DIR / 'divination_card.png')
-TRADE_BUTTON = imread(T_DIR / 'trade_button.png')
-TRADE_CLAIM = imread(T_DIR / 'trade_claim.png')
-TRADE_WINDOW = imread(T_DIR / 'trade_window.png')
+DIVINATION_CARD = templates['poe/divination_card.png']
+TRADE_BUTTON = templates['poe/trade_button.png']
+TRADE_CLAIM = templates['poe/trade_claim.png']
+TRADE_WINDOW = templates['poe/trade_window.png']
 
 
 def trade_cards():
@@ -0,0 +1,207 @@
+"""
+input over a persistent ydotoold socket, no ydotool process per event
+
+    seq = InputSequence().press(KEY_LEFTCTRL).move(*to_ydotool(x, y)).wait(0.05).click()
+    get_backend().run(seq.release(KEY_LEFTCTRL))
+"""
+import os
+import socket
+import struct
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+
+# linux/input-event-codes.h
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_REL = 0x02
+SYN_REPORT = 0
+REL_X = 0x00
+REL_Y = 0x01
+BTN_LEFT = 0x110
+BTN_RIGHT = 0x111
+KEY_LEFTCTRL = 29
+KEY_LEFTSHIFT = 42
+KEY_LEFTALT = 56
+MODIFIERS = {'ctrl': KEY_LEFTCTRL, 'shift': KEY_LEFTSHIFT, 'alt': KEY_LEFTALT}
+
+INPUT_EVENT = struct.Struct('llHHi')  # struct input_event: timeval, type, code, value
+INT32_MIN = -(2**31)
+YDOTOOL_SOCKET = os.environ.get('YDOTOOL_SOCKET', '/tmp/.ydotool_socket')
+
+# ydotool units are halved screen pixels, and we capture the right 2560px monitor
+SCREEN_X_OFFSET = 2560
+SCREEN_SCALE = 2
+
+Event = Tuple[int, int, int]  # type, code, value
+
+
+def to_ydotool(x, y) -> Tuple[int, int]:
+    """captured screen coords => ydotool absolute coords"""
+    return int((x + SCREEN_X_OFFSET) / SCREEN_SCALE), int(y / SCREEN_SCALE)
+
+
+class InputSequence:
+    """
+    steps of (delay before, events), each step is one SYN_REPORT frame
+    built up front and sent as a whole, delays are kept against one clock
+    """
+
+    def __init__(self):
+        self.steps: List[Tuple[float, List[Event]]] = []
+        self.pending_delay = 0.0
+
+    def __len__(self):
+        return len(self.steps)
+
+    def step(self, *events: Event):
+        self.steps.append((self.pending_delay, list(events)))
+        self.pending_delay = 0.0
+        return self
+
+    def wait(self, seconds):
+        self.pending_delay += seconds or 0
+        return self
+
+    def move(self, x, y):
+        """absolute: ydotool way, go to the top-left corner then move relative"""
+        self.step((EV_REL, REL_X, INT32_MIN), (EV_REL, REL_Y, INT32_MIN))
+        return self.step((EV_REL, REL_X, x), (EV_REL, REL_Y, y))
+
+    def press(self, code):
+        return self.step((EV_KEY, code, 1))
+
+    def release(self, code):
+        return self.step((EV_KEY, code, 0))
+
+    def tap(self, code):
+        return self.press(code).release(code)
+
+    def click(self, button=BTN_LEFT):
+        return self.tap(button)
+
+
+class InputBackend(ABC):
+    @abstractmethod
+    def write(self, events: List[Event]):
+        raise NotImplementedError
+
+    def sleep_until(self, deadline):
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self, seq: InputSequence):
+        start = time.perf_counter()
+        at = 0.0
+        for delay, events in seq.steps:
+            at += delay
+            if delay:
+                self.sleep_until(start + at)
+            self.write(events + [(EV_SYN, SYN_REPORT, 0)])
+        if seq.pending_delay:
+            self.sleep_until(start + at + seq.pending_delay)
+
+    def click(self, x=None, y=None, duration=0.0, modifier: Optional[str] = None):
+        """move + click in one sequence, with modifier held around it"""
+        seq = InputSequence()
+        if modifier:
+            seq.press(MODIFIERS[modifier])
+        if x is not None and y is not None:
+            seq.move(*to_ydotool(x, y)).wait(duration)
+        seq.click()
+        if modifier:
+            seq.release(MODIFIERS[modifier])
+        self.run(seq)
+
+    def mousemove(self, x, y):
+        self.run(InputSequence().move(*to_ydotool(x, y)))
+
+    def tap(self, code):
+        self.run(InputSequence().tap(code))
+
+    @contextmanager
+    def hold(self, code):
+        self.run(InputSequence().press(code))
+        try:
+            yield
+        finally:
+            self.run(InputSequence().release(code))
+
+
+class YdotoolSocket(InputBackend):
+    """
+    ydotoold reads one input_event per datagram, so a step is a burst of sends
+    on the already connected socket
+    """
+
+    def __init__(self, path=YDOTOOL_SOCKET):
+        self.path = path
+        self.sock = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def write(self, events: List[Event]):
+        data = [INPUT_EVENT.pack(0, 0, *event) for event in events]
+        for attempt in (0, 1):
+            if self.sock is None:
+                self.connect()
+            try:
+                for packet in data:
+                    self.sock.send(packet)
+                return
+            except OSError:  # ydotoold restarted
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class MockInput(InputBackend):
+    """records events with their offsets from run start, no sleeping"""
+
+    def __init__(self):
+        self.events: List[Tuple[float, Event]] = []
+
+    def run(self, seq: InputSequence):
+        at = 0.0
+        for delay, events in seq.steps:
+            at += delay
+            self.write(events + [(EV_SYN, SYN_REPORT, 0)], at)
+
+    def write(self, events: List[Event], at=0.0):
+        self.events.extend((at, event) for event in events)
+
+    def keys(self):
+        """[(code, value), ...] of key and button events"""
+        return [(code, value) for _, (kind, code, value) in self.events if kind == EV_KEY]
+
+
+_backend: Optional[InputBackend] = None
+
+
+def get_backend() -> InputBackend:
+    global _backend
+    if _backend is None:
+        _backend = YdotoolSocket()
+    return _backend
+
+
+def set_backend(backend: Optional[InputBackend]) -> Optional[InputBackend]:
+    """returns previous backend, None resets to the default"""
+    global _backend
+    prev, _backend = _backend, backend
+    return prev
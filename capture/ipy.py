@@ -2,6 +2,7 @@
 capture_loop(D2Handler)
 capture_loop(POEHandler)
 """
+import logging
 import time
 from functools import partial
 
@@ -16,10 +17,12 @@ from capture import ipy  # noqa autoreload self
 from capture.cv import put_text
 from capture.games.d2 import D2Handler
 from capture.games.poe import POEHandler
-from capture.ocr import run_ocr
-from capture.utils import ctx
+from capture.ocr import engine, run_ocr
+from capture.profiler import profiler
+from capture.utils import ctx, metrics, METRICS_EXPORT
 
 
+log = logging.getLogger(__name__)
 i = get_ipython()
 iem = i.extension_manager
 iem.load_extension('autoreload')
@@ -32,6 +35,8 @@ F_MON = sct.monitors[1]
 STEP = 20
 IMG = None
 DATA = 'default'
+EVENTS_DUMP_SECONDS = 30
+PROFILE_KEY = 'Pause'
 
 
 _SHOW = None  # Debug Image
@@ -89,10 +94,12 @@ def frames_process(cap, handler, after_frame=None):
         if k & 0xFF == ord('q'):
             break
 
-        t = time.time()
+        t = time.perf_counter()
+        profiler.begin_frame(c, handler.worker_threads)
         handler.frame(frame)
-        pt = time.time() - t
-        ctx.d(f'Process time: {pt:.3}')
+        pt = time.perf_counter() - t
+        profiler.end_frame(pt)
+        ctx.d('Process time: %.3f', pt)
 
         dbg(ctx.dbg)
 
@@ -104,11 +111,10 @@ def frames_process(cap, handler, after_frame=None):
             ctx.c.pop('kill_processing')
             return
 
-        if ctx.df is not None:
-            if ctx.gui_calls:
-                put_text(ctx.df, [str(c) for c in ctx.gui_calls], (10, 340))
-
-            cv2.imshow('video', ctx.df)
+        if gui_calls := ctx.gui_calls:
+            ctx.overlay.text(gui_calls, (10, 340))
+        if (rendered := ctx.render()) is not None:
+            cv2.imshow('video', rendered)
 
         if not positioned:
             positioned = True
@@ -153,8 +159,9 @@ def poe_frames(cap):
         #     return
 
         # life.frame(frame)
-        cv2.rectangle(frame, *life.rect, (255, 0, 255), 1)
-        put_text(frame, str(life.prev), life.rect[1])
+        if life.pos:
+            ctx.overlay.rect(life.pos)
+            ctx.overlay.text(str(life.prev), life.rect[1])
 
         # print(f'L: {life.prev} / {life.frames} / {life.conf}', flush=True)
 
@@ -162,10 +169,9 @@ def poe_frames(cap):
         #     cv2.imwrite('bad.png', orig)
         #     cv2.waitKey(10000)
 
-        to_show = frame.copy()
-        if ctx.gui_calls:
-            put_text(to_show, [str(c) for c in ctx.gui_calls], (10, 340))
-        cv2.imshow('video', to_show)
+        if gui_calls := ctx.gui_calls:
+            ctx.overlay.text(gui_calls, (10, 340))
+        cv2.imshow('video', ctx.render())
         if not positioned:
             positioned = True
             m2 = sct.monitors[2]
@@ -221,37 +227,53 @@ def dbg(strings):
             cv2.moveWindow(name, m2['left'], m2['top'])
 
 
-def capture_loop(handler=POEHandler):
+def capture_loop(handler=POEHandler, fps=60):
     game = handler()
+    engine.warmup()
+    if METRICS_EXPORT:
+        metrics.enable(METRICS_EXPORT)
     dbg(['Init capture'])
 
     try:
-        while True:
-            s = sct.grab(F_MON)
-            full = np.array(s)[:, :, :3]
-            game.frame(full)
-            dbg(ctx.dbg)
-
-            while ctx.c.get('pause_processing'):
-                dbg(['Paused...'] + ctx.dbg)
-                cv2.waitKey(30)
-
-            if ctx.c.get('kill_processing'):
-                ctx.c.pop('kill_processing')
-                dbg(['killed...'])
-                return
-
-            k = cv2.waitKey(8) & 0xFF
-
-            if k == ord('q'):
-                break
-
-            if ik(k, 'o'):
-                run_ocr(full)
-            else:
-                game.handle_key(k)
+        with ctx.screenshot_wrapper.stream(fps, game.regions) as frames:
+            for full, _, dropped, _ in frames:
+                t = time.perf_counter()
+                profiler.begin_frame(ctx.f_count + 1, game.worker_threads)
+                game.frame(full)
+                spent = time.perf_counter() - t
+                profiler.end_frame(spent)
+                metrics.observe('frame', spent)
+                metrics.count('frames')
+                if dropped:
+                    metrics.count('dropped', dropped)
+                    ctx.d('Dropped frames: %s', dropped)
+                dbg(ctx.dbg)
+
+                while ctx.c.get('pause_processing'):
+                    dbg(['Paused...'] + ctx.dbg)
+                    cv2.waitKey(30)
+
+                if ctx.c.get('kill_processing'):
+                    ctx.c.pop('kill_processing')
+                    dbg(['killed...'])
+                    return
+
+                k = cv2.waitKey(1) & 0xFF
+
+                if k == ord('q'):
+                    break
+
+                if ik(k, 'o'):
+                    run_ocr(full[:, :, :3])
+                elif ik(k, 'l'):
+                    path = f'events_{int(time.time())}.log'
+                    count = ctx.events.dump(path, seconds=EVENTS_DUMP_SECONDS)
+                    log.info(f'Dumped {count} events to {path}')
+                else:
+                    game.handle_key(k)
 
     finally:
+        game.close()
         cv2.destroyWindow('Life')
 
 
@@ -265,3 +287,18 @@ kb2 = ('super', 'shift', 'y')
 
 hk.register(kb, callback=lambda x: pause_processing(), overwrite=True)
 hk.register(kb2, callback=lambda x: kill_processing(), overwrite=True)
+
+
+def toggle_profiler(event, timestamp_ns):
+    if event == 'pressed':
+        profiler.toggle()
+
+
+try:
+    import system_bridge
+
+    shortcuts = system_bridge.Shortcuts()
+    shortcuts.register('profile', 'Toggle frame profiler', PROFILE_KEY, toggle_profiler)
+    shortcuts.bind('profile', PROFILE_KEY)
+except (ImportError, RuntimeError) as e:
+    log.warning(f'No profiler shortcut: {e}')
@@ -1,34 +1,265 @@
+import bisect
+import hashlib
 import json
+import os
+import re
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from contextlib import suppress
-from typing import List
+from pathlib import Path
+from typing import List, Optional
 
-import easyocr
+import cv2
+import numpy as np
 
 from fan_tools.python import py_rel_path
 
+from capture.cv import imread, merge_multi
 from capture.types import Img, Rect
+from capture.utils import ctx, metrics, timed
 
 
 CONF_THRESHOLD = 0.56  # OCR
 FILE_BASE = py_rel_path('../.data')
-FILE_BASE.mkdir(exist_ok=True)
+OCR_DEVICE = os.environ.get('CAPTURE_OCR_DEVICE', 'auto')
+DIGITS = '0123456789/,.'  # allowlist for "current / total" fields
+FRACTION = r'\d[\d,.]*/\d[\d,.]*'  # whole "current / total" read
+OCR_GAP = 16  # px between regions stacked for one pass, keeps detected lines apart
 
-reader = easyocr.Reader(['en'], gpu=True)
+
+class OCREngine:
+    """
+    easyocr reader created on first use: importing easyocr loads torch and the models
+    device: auto (gpu when torch sees cuda), cpu, cuda or cuda:N
+    """
+
+    def __init__(self, langs=('en',), device=OCR_DEVICE):
+        self.langs = list(langs)
+        self.device = device
+        self.lock = threading.Lock()
+        self._reader = None
+
+    def gpu(self):
+        if self.device == 'auto':
+            import torch
+
+            return torch.cuda.is_available()
+        if self.device == 'cpu':
+            return False
+        return self.device
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            with self.lock:
+                if self._reader is None:
+                    import easyocr
+
+                    self._reader = easyocr.Reader(self.langs, gpu=self.gpu())
+        return self._reader
+
+    @property
+    def ready(self):
+        return self._reader is not None
+
+    def warmup(self, background=True):
+        """load models ahead of the first frame"""
+        if not background:
+            return self.reader
+        thread = threading.Thread(target=lambda: self.reader, name='ocr-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    @timed('ocr.readtext')
+    def readtext(self, img: Img, **kwargs):
+        return self.reader.readtext(img, **kwargs)
+
+    @timed('ocr.recognize')
+    def recognize(self, img: Img, **kwargs):
+        """recognizer only, img is the text box"""
+        return self.reader.recognize(img, **kwargs)
+
+
+engine = OCREngine()
+
+
+class OCRCache:
+    """
+    LRU of readtext results keyed on crop content
+    low bits are dropped before hashing, so near-identical crops share a key
+    quant_bits: kept high bits, fewer merges dim text on dark background into one key
+    """
+
+    def __init__(self, max_size=256, quant_bits=6):
+        self.max_size = max_size
+        self.shift = 8 - quant_bits
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, img: Img, *options):
+        quantized = np.right_shift(img, self.shift, dtype=np.uint8)
+        digest = hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+        return img.shape, digest, *options
+
+    def readtext(self, img: Img, recognize=False, allowlist=None):
+        key = self.key(img, recognize, allowlist)
+        with self.lock:
+            data = self.items.get(key)
+            if data is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.export()
+        if data is not None:
+            metrics.count('ocr.cache_hits')
+            return data
+        metrics.count('ocr.cache_misses')
+
+        if recognize:
+            data = engine.recognize(img, allowlist=allowlist)
+        else:
+            data = engine.readtext(img, allowlist=allowlist)
+        with self.lock:
+            self.items[key] = data
+            if len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+        return data
+
+    def export(self):
+        ctx.set_float('ocr_cache_hits', self.hits)
+        ctx.set_float('ocr_cache_misses', self.misses)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+ocr_cache = OCRCache()
 
 
 def run_ocr(img: Img):
-    data = reader.readtext(img)
+    data = ocr_cache.readtext(img)
     return data
 
 
 def read_text(img: Img) -> List[str]:
-    data = reader.readtext(img)
+    data = ocr_cache.readtext(img)
     return [d[1] for d in data]
 
 
+def read_regions(images: dict) -> dict:
+    """
+    one ocr pass over several regions: stacked with merge_multi, results mapped back by y-offset
+    {name: img} => {name: readtext results with boxes in region coords}
+    """
+    if not images:
+        return {}
+    names = list(images)
+    starts = []
+    y = 0
+    for img in images.values():
+        starts.append(y)
+        y += img.shape[0] + OCR_GAP
+
+    out = {name: [] for name in names}
+    for box, text, confidence in ocr_cache.readtext(merge_multi(*images.values(), gap=OCR_GAP)):
+        center = sum(p[1] for p in box) / len(box)
+        idx = max(bisect.bisect_right(starts, center) - 1, 0)
+        dy = starts[idx]
+        out[names[idx]].append(([[p[0], p[1] - dy] for p in box], text, confidence))
+    return out
+
+
+GLYPH_NAMES = {'slash': '/', 'comma': ',', 'dot': '.'}
+CONF_THRESHOLD_GLYPH = 0.8
+
+
+class GlyphReader:
+    """
+    reads numbers by matching our own captured glyph images, no neural net
+    glyphs dir: one image per char, named 0.png .. 9.png, slash.png, comma.png, dot.png
+    """
+
+    def __init__(self, glyphs=None):
+        self.glyphs = {}  # char => gray template
+        for char, img in (glyphs or {}).items():
+            self.add(char, img)
+
+    @classmethod
+    def from_dir(cls, path: Path):
+        reader = cls()
+        if path.is_dir():
+            for f in sorted(path.glob('*.png')):
+                reader.add(GLYPH_NAMES.get(f.stem, f.stem), imread(f))
+        return reader
+
+    def add(self, char, img: Img):
+        self.glyphs[char] = to_gray(img)
+
+    def __bool__(self):
+        return bool(self.glyphs)
+
+    def read(self, img: Img, threshold=CONF_THRESHOLD_GLYPH):
+        """(text, confidence), confidence is the worst glyph score, ('', 0.0) on partial reads"""
+        gray = to_gray(img)
+        found = []  # (score, x, width, char)
+        for char, glyph in self.glyphs.items():
+            h, w = glyph.shape
+            if h > gray.shape[0] or w > gray.shape[1]:
+                continue
+            best = cv2.matchTemplate(gray, glyph, cv2.TM_CCOEFF_NORMED).max(axis=0)
+            xs = np.flatnonzero(best >= threshold)
+            found.extend((float(best[x]), int(x), w, char) for x in xs)
+
+        # glyph positions overlapping for more than half of the narrower glyph go to the best score
+        kept = []
+        for score, x, w, char in sorted(found, reverse=True):
+            if all(abs(x - kx) * 2 >= min(w, kw) for _, kx, kw, _ in kept):
+                kept.append((score, x, w, char))
+        if not kept:
+            return '', 0.0
+        if self.uncovered(gray, kept):
+            return '', 0.0  # a glyph was missed, the text would be partial
+        kept.sort(key=lambda k: k[1])
+        return ''.join(k[3] for k in kept), min(k[0] for k in kept)
+
+    @staticmethod
+    def uncovered(gray: Img, kept) -> bool:
+        """text columns not covered by any found glyph, text is the minority after otsu"""
+        _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if ink.mean() > 0.5:
+            ink = 1 - ink
+        columns = ink.any(axis=0)
+        for _, x, w, _ in kept:
+            columns[x : x + w] = False
+        return bool(columns.any())
+
+
+def to_gray(img: Img) -> Img:
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(np.ascontiguousarray(img[:, :, :3]), cv2.COLOR_BGR2GRAY)
+
+
 class OCRArea(ABC):
+    """
+    recognize_only: pos is the exact text box, skip text detection
+    allowlist: chars recognizer may output, e.g. DIGITS
+    glyphs: GlyphReader tried before OCR
+    pattern: glyph reads must fullmatch it, partial reads (a missed glyph) fall back to OCR
+    """
+
+    recognize_only = False
+    allowlist: Optional[str] = None
+    glyphs: Optional[GlyphReader] = None
+    pattern: Optional[str] = None
+
     def __init__(self, name):
+        self.name = name
         self.f = FILE_BASE / name
         self.pos = None
         self.last_img = None
@@ -46,10 +277,25 @@ class OCRArea(ABC):
 
     def set_pos(self, new_pos):
         self.pos = new_pos
+        FILE_BASE.mkdir(exist_ok=True)
         self.f.write_text(json.dumps(new_pos))
 
-    def ocr_one(self, img):
-        data = reader.readtext(img)
+    def prepare(self, img):
+        """crop preprocessing before ocr"""
+        return img
+
+    def ocr(self, img):
+        return ocr_cache.readtext(img, recognize=self.recognize_only, allowlist=self.allowlist)
+
+    def ocr_one(self, img, data=None):
+        """data: read_regions results for this area, no ocr call then"""
+        if data is None and self.glyphs:
+            s, confidence = self.glyphs.read(img)
+            if s and (self.pattern is None or re.fullmatch(self.pattern, s)):
+                return s, confidence
+
+        if data is None:
+            data = self.ocr(img)
         s, confidence = data[0][1], data[0][2]
         return s, confidence
 
@@ -0,0 +1,158 @@
+"""
+sampling profiler for the frame loop, stacks of the processing thread and of the
+detector pool workers are sampled from a background thread, so the loop is never paused
+or traced
+
+    profiler.toggle()  # from a shortcut, starts on the next frame
+    for full in frames:
+        profiler.begin_frame(ctx.f_count, game.worker_threads)
+        game.frame(full)
+        profiler.end_frame(spent)
+
+output, one pair per run:
+    profile_<time>.folded  collapsed stacks for flamegraph.pl / speedscope,
+                           rooted at frame_<n>[<ms>ms] (idle: waiting for the next frame)
+    profile_<time>.txt     slowest frames with their hottest functions
+"""
+import logging
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fan_tools.python import rel_path
+
+
+PROFILE_DIR = rel_path('../.data/profiles')
+PROFILE_FRAMES = 600  # ~10s at 60 fps
+PROFILE_INTERVAL = 0.002  # 500 Hz
+SLOWEST_SHOWN = 10
+IDLE = -1
+
+log = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, out_dir: Path = PROFILE_DIR):
+        self.interval = interval
+        self.out_dir = Path(out_dir)
+        self.lock = threading.Lock()
+        self.armed = 0  # frames to profile, set by toggle, picked up by begin_frame
+        self.sampler: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.labels: Dict[object, str] = {}  # code object => label
+        self.last_paths: Optional[Tuple[Path, Path]] = None
+        self._reset()
+
+    def _reset(self):
+        self.thread_id = None
+        self.workers: Optional[Callable[[], Iterable[int]]] = None  # threads busy with the frame
+        self.current = IDLE  # frame being processed
+        self.left = 0
+        self.samples: Counter = Counter()  # (frame, stack) => count
+        self.frame_times: List[Tuple[int, float]] = []
+
+    @property
+    def running(self):
+        return self.sampler is not None
+
+    def toggle(self, frames=PROFILE_FRAMES):
+        """safe from any thread: arm for the next frames, or stop a running profile"""
+        with self.lock:
+            if self.running:
+                self.stopping.set()
+                state = 'stopping'
+            else:
+                self.armed = 0 if self.armed else frames
+                state = f'armed for {frames} frames' if self.armed else 'disarmed'
+        log.info(f'Profiler {state}')
+
+    def begin_frame(self, idx: int, workers: Optional[Callable[[], Iterable[int]]] = None):
+        """workers: idents of threads busy with the frame, called on every sample while profiling"""
+        if self.armed and not self.running:
+            with self.lock:
+                if self.armed:
+                    self._start(self.armed)
+        if self.running and not self.stopping.is_set():
+            self.workers = workers
+            self.current = idx
+
+    def end_frame(self, spent: float):
+        if not self.running or self.stopping.is_set():
+            return
+        self.frame_times.append((self.current, spent))
+        self.current = IDLE
+        self.left -= 1
+        if self.left <= 0:
+            self.stopping.set()
+
+    def _start(self, frames):
+        """bound to the calling thread, the one that processes frames"""
+        self._reset()
+        self.armed = 0
+        self.left = frames
+        self.thread_id = threading.get_ident()
+        self.stopping.clear()
+        self.sampler = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.sampler.start()
+
+    def _run(self):
+        try:
+            while not self.stopping.wait(self.interval):
+                current, workers = self.current, self.workers
+                frames = sys._current_frames()
+                for ident in (self.thread_id, *(workers() if workers else ())):
+                    if (frame := frames.get(ident)) is not None:
+                        self.samples[current, self.collapse(frame)] += 1
+            self.last_paths = self.write()
+            log.info(f'Profile written: {self.last_paths[0]}')
+        finally:
+            self.sampler = None
+
+    def label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f'{Path(code.co_filename).stem}:{code.co_name}'
+        return label
+
+    def collapse(self, frame) -> str:
+        stack = []
+        while frame is not None:
+            stack.append(self.label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def roots(self) -> Dict[int, str]:
+        return {idx: f'frame_{idx}[{spent * 1000:.1f}ms]' for idx, spent in self.frame_times}
+
+    def write(self) -> Tuple[Path, Path]:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        name = f'profile_{time.strftime("%Y%m%d_%H%M%S")}'
+        folded, summary = self.out_dir / f'{name}.folded', self.out_dir / f'{name}.txt'
+        roots = self.roots()
+
+        with open(folded, 'w') as f:
+            for (idx, stack), count in sorted(self.samples.items()):
+                root = 'idle' if idx == IDLE else roots.get(idx, f'frame_{idx}')
+                f.write(f'{root};{stack} {count}\n')
+
+        leaves = defaultdict(Counter)  # frame => leaf function => samples
+        for (idx, stack), count in self.samples.items():
+            leaves[idx][stack.rpartition(';')[2]] += count
+        slowest = sorted(self.frame_times, key=lambda item: -item[1])[:SLOWEST_SHOWN]
+        total = sum(spent for _, spent in self.frame_times)
+        lines = [
+            f'frames: {len(self.frame_times)}, samples: {sum(self.samples.values())}, '
+            f'mean: {total / max(len(self.frame_times), 1) * 1000:.1f}ms',
+            'slowest frames:',
+        ]
+        for idx, spent in slowest:
+            hot = ', '.join(f'{fn} x{n}' for fn, n in leaves[idx].most_common(3))
+            lines.append(f'  frame {idx}: {spent * 1000:.1f}ms  {hot}')
+        summary.write_text('\n'.join(lines) + '\n')
+        return folded, summary
+
+
+profiler = SamplingProfiler()
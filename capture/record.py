@@ -0,0 +1,185 @@
+"""
+lossless frame archive: only regions of interest, xor delta to the previous frame + zlib
+
+archive dir:
+    meta.json   regions, frame shape, keyframe interval
+    frames.bin  compressed frame records, one after another
+    index.bin   INDEX_DTYPE row per frame, memory-mapped on playback
+"""
+import json
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from capture.common import crop
+from capture.types import Box, Img
+from capture.utils import ctx
+
+
+INDEX_DTYPE = np.dtype(
+    [('timestamp_ns', '<i8'), ('offset', '<u8'), ('size', '<u4'), ('keyframe', 'u1')]
+)
+KEYFRAME_INTERVAL = 120  # worst case seek decodes this many frames
+COMPRESS_LEVEL = 1
+
+
+class Recorder:
+    """
+    with Recorder(path, {'life': (130, 1083, 264, 1119)}) as rec:
+        rec.add(full)
+    regions=None stores full frames
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        regions: Optional[Dict[str, Box]] = None,
+        keyframe_interval=KEYFRAME_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.regions = dict(regions or {})
+        self.keyframe_interval = keyframe_interval
+        self.frames = open(self.path / 'frames.bin', 'wb')
+        self.index = open(self.path / 'index.bin', 'wb')
+        self.offset = 0
+        self.count = 0
+        self.prev = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_meta(self, full: Optional[Img]):
+        """full: first frame, None for a recording without frames"""
+        if not self.regions and full is not None:
+            self.regions = {'full': (0, 0, full.shape[1], full.shape[0])}
+        meta = {
+            'frame_shape': None if full is None else [full.shape[0], full.shape[1], 3],
+            'regions': {name: list(rect) for name, rect in self.regions.items()},
+            'keyframe_interval': self.keyframe_interval,
+        }
+        (self.path / 'meta.json').write_text(json.dumps(meta, indent=2))
+
+    def add(self, full: Img, timestamp_ns: Optional[int] = None):
+        if self.count == 0:
+            self.write_meta(full)
+
+        data = np.concatenate([crop(full, rect).ravel() for rect in self.regions.values()])
+        keyframe = self.count % self.keyframe_interval == 0
+        delta = data if keyframe else np.bitwise_xor(data, self.prev)
+        blob = zlib.compress(delta.tobytes(), COMPRESS_LEVEL)
+
+        self.frames.write(blob)
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()  # same clock as ScreenshotWrapper.stream
+        row = (timestamp_ns, self.offset, len(blob), keyframe)
+        self.index.write(np.array([row], dtype=INDEX_DTYPE).tobytes())
+        self.offset += len(blob)
+        self.count += 1
+        self.prev = data
+
+    def close(self):
+        if self.count == 0:
+            self.write_meta(None)  # still a valid, empty archive
+        self.frames.close()
+        self.index.close()
+
+
+def record(path: Path, regions: Optional[Dict[str, Box]] = None, seconds=60, fps=60):
+    """record screen regions for given seconds, frames come only when the regions change"""
+    rects = list(regions.values()) if regions else None
+    with Recorder(path, regions) as rec:
+        with ctx.screenshot_wrapper.stream(fps, rects, seconds=seconds) as frames:
+            for full, timestamp_ns, _, _ in frames:
+                rec.add(full, timestamp_ns or None)
+    return rec.count
+
+
+class Playback:
+    """random access to a Recorder archive, frames decode from the nearest keyframe"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        meta = json.loads((self.path / 'meta.json').read_text())
+        self.frame_shape = tuple(meta['frame_shape'] or ())
+        self.regions = {name: tuple(rect) for name, rect in meta['regions'].items()}
+        self.shapes = {
+            name: (y1 - y0, x1 - x0, 3) for name, (x0, y0, x1, y1) in self.regions.items()
+        }
+        self.index = self._map(self.path / 'index.bin', INDEX_DTYPE)
+        self.data = self._map(self.path / 'frames.bin', np.uint8)
+        self.last = None  # (idx, decoded flat buffer) for sequential reads
+
+    @staticmethod
+    def _map(path: Path, dtype):
+        """np.memmap can't map an empty file: no frames recorded"""
+        if path.stat().st_size == 0:
+            return np.zeros(0, dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    @staticmethod
+    def is_archive(path: Path):
+        return (Path(path) / 'meta.json').exists() and (Path(path) / 'index.bin').exists()
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index['timestamp_ns']
+
+    def seek(self, timestamp_ns) -> int:
+        """last frame taken at or before timestamp"""
+        return max(int(np.searchsorted(self.timestamps, timestamp_ns, side='right')) - 1, 0)
+
+    def _blob(self, idx):
+        row = self.index[idx]
+        start = int(row['offset'])
+        raw = zlib.decompress(self.data[start : start + int(row['size'])])
+        return np.frombuffer(raw, dtype=np.uint8)
+
+    def _decode(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+
+        keyframe = int(np.flatnonzero(self.index['keyframe'][: idx + 1])[-1])
+        if self.last is not None and keyframe <= self.last[0] <= idx:
+            start, data = self.last[0] + 1, self.last[1]
+        else:
+            start, data = keyframe + 1, self._blob(keyframe)
+        for i in range(start, idx + 1):
+            blob = self._blob(i)
+            data = blob if self.index[i]['keyframe'] else np.bitwise_xor(data, blob)
+        self.last = (idx, data)
+        return data
+
+    def __getitem__(self, idx) -> Dict[str, Img]:
+        """{region name: image}"""
+        data = self._decode(idx)
+        out = {}
+        pos = 0
+        for name, shape in self.shapes.items():
+            size = int(np.prod(shape))
+            out[name] = data[pos : pos + size].reshape(shape)
+            pos += size
+        return out
+
+    def frame(self, idx) -> Img:
+        """full size frame, black outside of recorded regions"""
+        full = np.zeros(self.frame_shape, dtype=np.uint8)
+        for name, img in self[idx].items():
+            x0, y0, x1, y1 = self.regions[name]
+            full[y0:y1, x0:x1] = img
+        return full
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.frame(idx)
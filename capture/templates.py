@@ -0,0 +1,248 @@
+"""
+templates/ registry: every png loaded once, derived forms computed once per template
+
+    from capture.templates import templates
+    WP_IMAGE = templates['poe/wp.png']
+    match_image(screen, WP_IMAGE, pyramid=2)
+
+handles are accepted by capture.cv functions in place of images
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import threading
+from contextlib import suppress
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from fan_tools.python import rel_path
+
+from capture.types import Img
+
+
+TEMPLATES_DIR = rel_path('../templates')
+log = logging.getLogger(__name__)
+
+
+class Template:
+    """lazy handle, image is read on first use"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.levels: Dict[int, Img] = {}
+        self.mask_levels: Dict[int, Img] = {}
+
+    def __repr__(self):
+        return f'Template({self.path.name})'
+
+    @cached_property
+    def raw(self) -> Img:
+        raw = cv2.imread(str(self.path), cv2.IMREAD_UNCHANGED)
+        if raw is None:
+            raise FileNotFoundError(self.path)
+        return raw
+
+    @cached_property
+    def img(self) -> Img:
+        if self.raw.ndim == 2:
+            return cv2.cvtColor(self.raw, cv2.COLOR_GRAY2BGR)
+        return np.ascontiguousarray(self.raw[:, :, :3])
+
+    @cached_property
+    def gray(self) -> Img:
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def mask(self) -> Optional[Img]:
+        """from alpha channel, None for opaque templates"""
+        if self.raw.ndim != 3 or self.raw.shape[2] != 4 or self.raw[:, :, 3].min() == 255:
+            return None
+        return np.where(self.raw[:, :, 3] > 0, 255, 0).astype(np.uint8)
+
+    @cached_property
+    def key(self) -> str:
+        """stable content hash"""
+        return hashlib.blake2b(self.img.tobytes(), digest_size=16).hexdigest()
+
+    @property
+    def shape(self):
+        return self.img.shape
+
+    def pyramid(self, level: int) -> Img:
+        """img downscaled 2**level times"""
+        if level not in self.levels:
+            scale = 1 / 2**level
+            self.levels[level] = cv2.resize(
+                self.img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        return self.levels[level]
+
+    def pyramid_mask(self, level: int) -> Optional[Img]:
+        """mask downscaled same as pyramid(level)"""
+        if self.mask is None:
+            return None
+        if level not in self.mask_levels:
+            scale = 1 / 2**level
+            self.mask_levels[level] = cv2.resize(
+                self.mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST
+            )
+        return self.mask_levels[level]
+
+    def reload(self):
+        for name in ('raw', 'img', 'gray', 'mask', 'key'):
+            self.__dict__.pop(name, None)
+        self.levels = {}
+        self.mask_levels = {}
+
+    def __array__(self, dtype=None, copy=None):
+        return self.img if dtype is None else self.img.astype(dtype)
+
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+class Inotify:
+    """minimal inotify over libc"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs: Dict[int, Path] = {}  # watch descriptor => dir
+
+    def add(self, path: Path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed: {path}')
+        self.dirs[wd] = Path(path)
+
+    def read(self):
+        """blocks until events: [(path, mask), ...]"""
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = os.fsdecode(data[pos : pos + length].rstrip(b'\0'))
+            pos += length
+            if wd in self.dirs:
+                events.append((self.dirs[wd] / name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TemplateRegistry:
+    """
+    handles are created once per path
+    directory listings are cached while the inotify watcher runs, listed every call otherwise
+    close() stops the watcher and releases the inotify fd
+    """
+
+    def __init__(self, root: Path = TEMPLATES_DIR):
+        self.root = Path(root)
+        self.items: Dict[Path, Template] = {}
+        self.listings: Dict[tuple, List[Template]] = {}
+        self.lock = threading.Lock()
+        self.watcher: Optional[threading.Thread] = None
+        self.wake: Optional[int] = None  # pipe write end, wakes the watcher up to exit
+        self.version = 0  # bumped on every change under root
+
+    def get(self, name) -> Template:
+        """name is relative to root, like poe/wp.png"""
+        path = self.root / name
+        with self.lock:
+            if path not in self.items:
+                self.items[path] = Template(path)
+            return self.items[path]
+
+    __getitem__ = get
+
+    def glob(self, subdir, pattern='*.png') -> List[Template]:
+        self.watch()
+        key = (subdir, pattern)
+        listing = self.listings.get(key)
+        if listing is None:
+            version = self.version
+            paths = sorted((self.root / subdir).glob(pattern))
+            listing = [self.get(p.relative_to(self.root)) for p in paths]
+            with self.lock:
+                if self.watcher and version == self.version:
+                    self.listings[key] = listing
+        return listing
+
+    def watch(self):
+        """start inotify watcher thread once, no-op where inotify is unavailable"""
+        with self.lock:
+            if self.watcher is not None or not self.root.is_dir():
+                return
+            try:
+                inotify = Inotify()
+                for path in [self.root, *(p for p in self.root.rglob('*') if p.is_dir())]:
+                    inotify.add(path)
+            except (OSError, AttributeError) as e:
+                log.warning(f'No template watching: {e}')
+                self.watcher = False
+                return
+            wake_r, self.wake = os.pipe()
+            self.watcher = threading.Thread(
+                target=self._watch_loop,
+                args=(inotify, wake_r),
+                name='templates-watch',
+                daemon=True,
+            )
+            self.watcher.start()
+
+    def _watch_loop(self, inotify: Inotify, wake_r: int):
+        try:
+            while True:
+                ready, _, _ = select.select([inotify.fd, wake_r], [], [])
+                if wake_r in ready:
+                    return
+                for path, mask in inotify.read():
+                    self.changed(path, mask)
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        with suppress(OSError):
+                            inotify.add(path)
+        finally:
+            inotify.close()
+            os.close(wake_r)
+
+    def close(self):
+        """stop watching, listings are not cached after"""
+        with self.lock:
+            watcher, self.watcher = self.watcher, False
+            self.listings.clear()
+            wake, self.wake = self.wake, None
+        if wake is not None:
+            os.write(wake, b'x')
+            os.close(wake)
+        if watcher:
+            watcher.join()
+
+    def changed(self, path: Path, mask=0):
+        with self.lock:
+            self.version += 1
+            self.listings.clear()
+            if template := self.items.get(path):
+                template.reload()
+
+
+templates = TemplateRegistry()
@@ -0,0 +1,42 @@
+import json
+
+import cv2
+import numpy as np
+
+from capture.bench import iter_frames, main
+from capture.common import Handler
+from capture.utils import ctx, dtime
+
+
+@dtime('check')
+def check(full):
+    return full.mean()
+
+
+class BenchHandler(Handler):
+    def __init__(self):
+        ctx.reset()
+
+    def frame(self, full):
+        ctx.frame(full)
+        ctx.show('never', full)
+        check(full)
+
+    def handle_key(self, char):
+        pass
+
+
+def test_01_replay_dir(tmp_path, capsys):
+    for i in range(5):
+        cv2.imwrite(str(tmp_path / f'{i:04}.png'), np.full((8, 8, 3), i, np.uint8))
+    assert [f[0, 0, 0] for f in iter_frames(tmp_path, skip=1, limit=3)] == [1, 2, 3]
+
+    main([f'{__name__}:BenchHandler', str(tmp_path), '--skip', '1'])
+    report = json.loads(capsys.readouterr().out)
+
+    assert report['handler'] == 'BenchHandler'
+    assert report['frames'] == 4
+    assert report['detectors_ms']['check']['count'] == 4
+    assert {'p50', 'p90', 'p99', 'max'} <= set(report['latency_ms'])
+    assert report['peak_rss_mb'] > 0
+    assert not ctx.headless
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+import pytest
+
+from capture import cv
+from capture.cv import TemplateBank
+
+
+def random_img(shape, seed=0):
+    return np.random.default_rng(seed).integers(0, 255, shape, dtype=np.uint8)
+
+
+@pytest.mark.parametrize('batch_size', [2**30, 0], ids=['stacked', 'matchTemplate'])
+def test_template_bank_matches_opencv(monkeypatch, batch_size):
+    monkeypatch.setattr(cv, 'MAX_BATCH_SIZE', batch_size)
+    img = random_img((40, 60, 3))
+    templates = {i: random_img((12, 9, 3), seed=i + 1) for i in range(4)}
+    templates['crop'] = img[10:22, 20:29].copy()
+    templates['big'] = random_img((20, 15, 3), seed=10)
+    bank = TemplateBank(templates)
+
+    for label, conf in bank.scores(img):
+        res = cv2.matchTemplate(img, templates[label], cv2.TM_CCOEFF_NORMED)
+        assert abs(conf - cv2.minMaxLoc(res)[1]) < 1e-4
+
+    label, conf = bank.best(img)
+    assert label == 'crop'
+    assert conf > 0.99
+
+
+def test_template_bank_skips_larger_templates():
+    bank = TemplateBank({'big': random_img((20, 20, 3))})
+    assert bank.best(random_img((10, 10, 3))) == (None, 0.0)
+
+
+def test_match_many_nms():
+    from capture.cv import match_image, match_many
+
+    img = random_img((120, 160, 3), seed=20)
+    template = random_img((10, 16, 3), seed=21)
+    places = [(5, 8), (100, 60), (40, 90)]
+    for i, (x, y) in enumerate(places):
+        # later places are noisier, so less similar
+        noise = random_img((10, 16, 3), seed=30 + i) // 8 * i
+        img[y : y + 10, x : x + 16] = template // 2 + noise // 2
+
+    matches = match_many(img, template, threshold=0.5)
+    assert [(m.x, m.y) for m in matches] == places
+    assert (np.diff(matches.score) <= 0).all()
+    assert (matches.w == 16).all()
+    assert (matches.h == 10).all()
+
+    rect = match_image(img, template)
+    assert (rect.x, rect.y, rect.w, rect.h) == (5, 8, 16, 10)
+
+
+def test_match_pyramid():
+    from capture.cv import match_image
+
+    img = cv2.GaussianBlur(random_img((300, 500, 3), seed=40), (9, 9), 0)
+    for x, y in [(0, 0), (123, 77), (440, 260)]:
+        template = img[y : y + 40, x : x + 60].copy()
+        assert match_image(img, template, pyramid=2) == match_image(img, template)
+
+    # too small to downscale twice, falls back to fewer levels
+    template = img[50:62, 70:90].copy()
+    assert match_image(img, template, pyramid=2) == (70, 50, 20, 12)
+    assert match_image(img, random_img((40, 60, 3), seed=41), pyramid=2) is None
+
+
+def test_location_prior():
+    from capture.cv import LocationPrior
+
+    img = random_img((200, 300, 3), seed=50)
+    template = img[100:120, 150:180].copy()
+    prior = LocationPrior(margin=10, max_misses=2)
+
+    assert prior.match(img, template) == (150, 100, 30, 20)
+    assert prior.match(img, template) == (150, 100, 30, 20)
+    assert (prior.hits, prior.misses) == (1, 1)
+
+    # moved out of the window: full frame search finds it
+    moved = random_img((200, 300, 3), seed=51)
+    moved[10:30, 20:50] = template
+    assert prior.match(moved, template) == (20, 10, 30, 20)
+
+    gone = random_img((200, 300, 3), seed=52)
+    assert prior.match(gone, template) is None
+    assert prior.last
+    assert prior.match(gone, template) is None
+    assert not prior.last
+
+
+def test_debug_overlay():
+    from capture.cv import DebugOverlay
+
+    img = np.zeros((40, 60, 4), dtype=np.uint8)
+    overlay = DebugOverlay()
+    overlay.label((5, 20, 30, 35), 'x')
+    overlay.text(['a', 'b'], (2, 10))
+    assert len(overlay) == 3
+
+    out = overlay.render(img)
+    assert out.shape == (40, 60, 3)
+    assert out[20, 5].tolist() == [255, 0, 255]
+    assert not img.any()
@@ -0,0 +1,89 @@
+import socket
+
+import pytest
+
+from capture.input import (
+    BTN_LEFT,
+    EV_KEY,
+    EV_REL,
+    EV_SYN,
+    INPUT_EVENT,
+    INT32_MIN,
+    KEY_LEFTCTRL,
+    REL_X,
+    InputSequence,
+    MockInput,
+    YdotoolSocket,
+    get_backend,
+    set_backend,
+)
+from capture.utils import Click, Hold, Release, Wait
+
+
+@pytest.fixture
+def mock_input():
+    backend = MockInput()
+    prev = set_backend(backend)
+    yield backend
+    set_backend(prev)
+
+
+def test_01_sequence_delays():
+    backend = MockInput()
+    seq = InputSequence().press(KEY_LEFTCTRL).wait(0.05).click()
+    backend.run(seq.wait(0.1).release(KEY_LEFTCTRL))
+    at = [t for t, (kind, _, _) in backend.events if kind == EV_KEY]
+    assert at == [0, 0.05, 0.05, pytest.approx(0.15)]
+    assert backend.keys() == [(KEY_LEFTCTRL, 1), (BTN_LEFT, 1), (BTN_LEFT, 0), (KEY_LEFTCTRL, 0)]
+
+
+def test_02_gui_click(ctx, mock_input):
+    assert ctx.gui.click(100, 20, duration=0, modifier='ctrl')
+    assert mock_input.keys() == [(KEY_LEFTCTRL, 1), (BTN_LEFT, 1), (BTN_LEFT, 0), (KEY_LEFTCTRL, 0)]
+    moves = [v for _, (kind, code, v) in mock_input.events if (kind, code) == (EV_REL, REL_X)]
+    assert moves == [INT32_MIN, (100 + 2560) // 2]
+
+
+def test_03_ydotool_socket(tmp_path):
+    path = str(tmp_path / 'ydotool.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    server.bind(path)
+    try:
+        backend = YdotoolSocket(path)
+        backend.run(InputSequence().click())
+        events = [INPUT_EVENT.unpack(server.recv(64))[2:] for _ in range(4)]
+        backend.close()
+    finally:
+        server.close()
+    assert events == [(EV_KEY, BTN_LEFT, 1), (EV_SYN, 0, 0), (EV_KEY, BTN_LEFT, 0), (EV_SYN, 0, 0)]
+
+
+def test_04_action_scheduler(ctx, mock_input):
+    ran = ctx.actions.submit([Hold('ctrl'), Click(10, 20), Wait(0.01), Release('ctrl')])
+    assert ran.result(timeout=5) is True
+    assert mock_input.keys() == [
+        (KEY_LEFTCTRL, 1),
+        (BTN_LEFT, 1),
+        (BTN_LEFT, 0),
+        (KEY_LEFTCTRL, 0),
+    ]
+
+    # guard fires during the wait, held ctrl is released anyway
+    mock_input.events.clear()
+    pressed = lambda: bool(mock_input.keys())  # noqa: E731
+    macro = ctx.actions.submit([Hold('ctrl'), Wait(5), Click()], cancel_if=pressed)
+    assert macro.result(timeout=5) is False
+    assert mock_input.keys() == [(KEY_LEFTCTRL, 1), (KEY_LEFTCTRL, 0)]
+
+
+def test_05_mocked_macro(ctx):
+    with ctx.mock_gui():
+        backend = get_backend()
+        assert isinstance(backend, MockInput)
+        ran = ctx.actions.submit([Hold('ctrl'), Click(10, 20, duration=0), Release('ctrl')])
+        assert ran.result(timeout=5) is True
+        keys = backend.keys()
+        assert keys == [(KEY_LEFTCTRL, 1), (BTN_LEFT, 1), (BTN_LEFT, 0), (KEY_LEFTCTRL, 0)]
+        calls = [line.split(' <= ')[0] for line in ctx.gui_calls[-3:]]
+        assert calls == ['hotkey: ctrl down', 'click: 10,20 0.00s', 'hotkey: ctrl up']
+    assert get_backend() is not backend
@@ -0,0 +1,147 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from capture.ocr import OCRCache, OCREngine
+
+
+class Reader:
+    def __init__(self):
+        self.calls = 0
+
+    def readtext(self, img, **kwargs):
+        self.calls += 1
+        return [([[0, 0], [1, 0], [1, 1], [0, 1]], 'text', 0.9)]
+
+
+def test_01_engine_is_lazy():
+    engine = OCREngine(device='cpu')
+    assert not engine.ready
+    assert engine.gpu() is False
+
+    # fresh interpreter: other tests may have imported them already
+    code = 'import sys, capture.ocr; print(sorted({"easyocr", "torch"} & set(sys.modules)))'
+    root = Path(__file__).parents[2]
+    out = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=root
+    )
+    assert out.stdout.strip() == '[]'
+
+
+def test_02_cache_hit(ctx, monkeypatch):
+    reader = Reader()
+    engine = OCREngine(device='cpu')
+    engine._reader = reader
+    monkeypatch.setattr('capture.ocr.engine', engine)
+    ctx.reset()
+
+    cache = OCRCache(max_size=2)
+    img = np.random.randint(0, 255, (20, 60, 3), dtype=np.uint8)
+    assert cache.readtext(img) == cache.readtext(img | 1)  # low bits ignored
+    assert reader.calls == 1
+
+    cache.readtext(img[:, :30])
+    cache.readtext(img[:, :20])
+    cache.readtext(img)  # evicted
+    assert reader.calls == 4
+    assert ctx.floats('ocr_cache_hits') == 1
+    assert ctx.floats('ocr_cache_misses') == 4
+
+
+def test_03_glyph_reader():
+    import cv2
+
+    from capture.ocr import GlyphReader
+
+    def glyph(char):
+        img = np.zeros((24, 16), dtype=np.uint8)
+        cv2.putText(img, char, (1, 19), cv2.FONT_HERSHEY_SIMPLEX, 0.7, 255, 2)
+        return img
+
+    chars = '0123456789/'
+    reader = GlyphReader({c: glyph(c) for c in chars})
+    text = '120/987'
+    img = np.hstack([np.zeros((24, 5), np.uint8)] + [glyph(c) for c in text])
+    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+    found, conf = reader.read(img)
+    assert found == text
+    assert conf > 0.99
+    assert GlyphReader().read(img) == ('', 0.0)
+
+    # no glyph for 9: "120/87" would be a wrong number, not a read
+    partial = GlyphReader({c: glyph(c) for c in chars if c != '9'})
+    assert partial.read(img) == ('', 0.0)
+
+
+def test_04_read_regions(monkeypatch):
+    from capture.ocr import OCR_GAP, read_regions
+
+    class Merged(Reader):
+        def readtext(self, img, **kwargs):
+            super().readtext(img)
+            # one line in the middle of each stacked region
+            second = 10 + OCR_GAP
+            return [
+                ([[0, 2], [9, 2], [9, 8], [0, 8]], 'first', 0.9),
+                ([[0, second + 5], [9, second + 5], [9, second + 15], [0, second + 15]], 'b', 0.8),
+            ]
+
+    reader = Merged()
+    engine = OCREngine(device='cpu')
+    engine._reader = reader
+    monkeypatch.setattr('capture.ocr.engine', engine)
+    monkeypatch.setattr('capture.ocr.ocr_cache', OCRCache())
+
+    images = {
+        'a': np.zeros((10, 40, 3), dtype=np.uint8),
+        'b': np.zeros((20, 30, 3), dtype=np.uint8),
+        'c': np.zeros((5, 30, 3), dtype=np.uint8),
+    }
+    res = read_regions(images)
+    assert reader.calls == 1
+    assert [t[1] for t in res['a']] == ['first']
+    assert res['b'] == [([[0, 5], [9, 5], [9, 15], [0, 15]], 'b', 0.8)]
+    assert res['c'] == []
+
+
+def test_05_cache_key_keeps_digits():
+    import cv2
+
+    def digits(text):
+        img = np.full((24, 120, 3), 8, dtype=np.uint8)  # dim text on dark background
+        cv2.putText(img, text, (2, 18), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (28, 28, 28), 1)
+        return img
+
+    cache = OCRCache()
+    a, b = digits('1234/5678'), digits('1234/5679')
+    assert not np.array_equal(a, b)
+    assert cache.key(a) != cache.key(b)
+    assert cache.key(a) == cache.key(a | 1)
+    assert OCRCache(quant_bits=3).key(a) == OCRCache(quant_bits=3).key(b)  # what 3 bits did
+
+
+def test_06_glyph_read_validated(monkeypatch):
+    from capture.ocr import FRACTION, OCRArea
+
+    class Glyphs:
+        def read(self, img):
+            return self.text, 0.95
+
+    class Area(OCRArea):
+        glyphs = Glyphs()
+        pattern = FRACTION
+
+        def frame(self, data):
+            pass
+
+    area = Area('test_area')
+    monkeypatch.setattr(area, 'ocr', lambda img: [(None, '1,234/5,678', 0.7)])
+    img = np.zeros((10, 10, 3), np.uint8)
+
+    area.glyphs.text = '1,234/5,678'
+    assert area.ocr_one(img) == ('1,234/5,678', 0.95)
+    area.glyphs.text = '1,234/'
+    assert area.ocr_one(img) == ('1,234/5,678', 0.7)
@@ -0,0 +1,70 @@
+import time
+
+from capture.common import DetectorGraph
+from capture.profiler import SamplingProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_01_profile_frames(tmp_path):
+    profiler = SamplingProfiler(interval=0.001, out_dir=tmp_path)
+    profiler.begin_frame(0)
+    assert not profiler.running
+
+    profiler.toggle(frames=3)
+    sampler = None
+    for idx in range(1, 6):
+        profiler.begin_frame(idx)
+        sampler = sampler or profiler.sampler
+        t = time.perf_counter()
+        busy(0.06 if idx == 2 else 0.02)
+        profiler.end_frame(time.perf_counter() - t)
+    sampler.join(timeout=5)
+
+    assert not profiler.running
+    folded, summary = profiler.last_paths
+    lines = folded.read_text().splitlines()
+    assert lines
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert {line.split(';', 1)[0].split('[')[0] for line in lines} <= {
+        'frame_1',
+        'frame_2',
+        'frame_3',
+        'idle',
+    }
+    assert any('test_profiler:busy' in line for line in lines)
+
+    slowest = summary.read_text().splitlines()[2]
+    assert slowest.startswith('  frame 2: ')
+    assert 'test_profiler:busy' in slowest
+
+
+def test_02_profile_pool_workers(tmp_path):
+    graph = DetectorGraph(workers=2).add('busy', lambda full: busy(0.03))
+    profiler = SamplingProfiler(interval=0.001, out_dir=tmp_path)
+    profiler.toggle(frames=3)
+    try:
+        sampler = None
+        for idx in range(1, 4):
+            profiler.begin_frame(idx, graph.active_threads)
+            sampler = sampler or profiler.sampler
+            t = time.perf_counter()
+            graph.run(None)
+            profiler.end_frame(time.perf_counter() - t)
+            time.sleep(0.02)  # pool threads idle, not sampled
+        sampler.join(timeout=5)
+    finally:
+        graph.close()
+
+    folded, _ = profiler.last_paths
+    lines = folded.read_text().splitlines()
+    worker = [line for line in lines if 'test_profiler:busy' in line]
+    assert worker
+    assert all(line.startswith(('frame_1', 'frame_2', 'frame_3')) for line in worker)
+    # pool threads are sampled only while they run a check
+    pooled = [line for line in lines if 'thread:_worker' in line]
+    assert all('common:_timed' in line for line in pooled)
@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+
+from capture.bench import iter_frames
+from capture.record import Playback, Recorder, record
+
+
+def test_01_roundtrip(tmp_path):
+    rng = np.random.default_rng(1)
+    full = rng.integers(0, 255, (60, 80, 4), dtype=np.uint8)
+    regions = {'a': (0, 0, 20, 10), 'b': (30, 40, 80, 60)}
+    frames = []
+    with Recorder(tmp_path, regions, keyframe_interval=4) as rec:
+        for i in range(10):
+            full = full.copy()
+            full[i : i + 5, i : i + 20] = rng.integers(0, 255, (5, 20, 4), dtype=np.uint8)
+            frames.append(full)
+            rec.add(full, timestamp_ns=1000 * i)
+
+    play = Playback(tmp_path)
+    assert len(play) == 10
+    assert play.seek(3500) == 3
+    for idx in (7, 2, 3, 9, 0, 8):
+        out = play[idx]
+        assert np.array_equal(out['a'], frames[idx][0:10, 0:20, :3])
+        assert np.array_equal(out['b'], frames[idx][40:60, 30:80, :3])
+
+    replayed = list(iter_frames(tmp_path, skip=8))
+    assert len(replayed) == 2
+    assert replayed[0].shape == (60, 80, 3)
+    assert np.array_equal(replayed[1][40:60, 30:80], frames[9][40:60, 30:80, :3])
+    assert not replayed[1][20:30].any()
+
+
+def test_02_empty_recording(tmp_path):
+    Recorder(tmp_path, {'a': (0, 0, 20, 10)}).close()
+
+    assert Playback.is_archive(tmp_path)
+    play = Playback(tmp_path)
+    assert len(play) == 0
+    assert list(play) == []
+    assert list(iter_frames(tmp_path)) == []
+
+
+def test_03_record_static_screen(ctx, tmp_path, monkeypatch):
+    wrapper = ctx.screenshot_wrapper
+    monkeypatch.setattr(wrapper, 'has_native', False)
+    monkeypatch.setattr(wrapper, 'view', lambda: np.zeros((60, 80, 3), dtype=np.uint8))
+
+    t = time.monotonic()
+    count = record(tmp_path, {'a': (0, 0, 20, 10)}, seconds=0.2, fps=100)
+    assert time.monotonic() - t < 2
+    assert count == 1  # nothing changes after the first frame
+
+    play = Playback(tmp_path)
+    assert abs(int(play.timestamps[0]) - time.monotonic_ns()) < 5e9
@@ -16,6 +16,21 @@ def test_capture_raw_callable():
     assert callable(system_bridge.capture_raw)
 
 
+def test_capturer_class():
+    assert hasattr(system_bridge, 'Capturer')
+    assert isinstance(system_bridge.Capturer, type)
+    assert callable(system_bridge.Capturer.capture)
+    assert callable(system_bridge.Capturer.capture_raw)
+    assert callable(system_bridge.Capturer.capture_view)
+    assert callable(system_bridge.Capturer.capture_regions)
+    assert callable(system_bridge.Capturer.stream)
+
+
+def test_frame_stream_class():
+    assert hasattr(system_bridge, 'FrameStream')
+    assert isinstance(system_bridge.FrameStream, type)
+
+
 def test_shortcuts_class():
     assert hasattr(system_bridge, 'Shortcuts')
     assert isinstance(system_bridge.Shortcuts, type)
@@ -0,0 +1,71 @@
+import time
+
+import cv2
+import numpy as np
+
+from capture.cv import LocationPrior, match_image
+from capture.templates import TemplateRegistry
+
+
+def write(path, img):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    assert cv2.imwrite(str(path), img)
+
+
+def test_01_handle(tmp_path):
+    img = np.random.default_rng(0).integers(0, 255, (60, 80, 3), dtype=np.uint8)
+    write(tmp_path / 'game/button.png', img[10:30, 20:52])
+    alpha = np.dstack([img[:8, :8], np.eye(8, dtype=np.uint8) * 255])
+    write(tmp_path / 'game/alpha.png', alpha)
+
+    registry = TemplateRegistry(tmp_path)
+    button = registry['game/button.png']
+    assert registry.get('game/button.png') is button
+    assert button.shape == (20, 32, 3)
+    assert button.pyramid(1).shape == (10, 16, 3)
+    assert registry['game/alpha.png'].shape == (8, 8, 3)
+    assert registry['game/alpha.png'].mask.shape == (8, 8)
+    assert button.gray.shape == (20, 32)
+    assert button.mask is None
+
+    key = button.key
+    assert TemplateRegistry(tmp_path)['game/button.png'].key == key
+    assert match_image(img, button) == (20, 10, 32, 20)
+    assert LocationPrior().match(img, button) == (20, 10, 32, 20)
+
+
+def test_01b_alpha_mask(tmp_path):
+    rng = np.random.default_rng(2)
+    img = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    icon = img[40:72, 60:100].copy()
+    alpha = np.zeros(icon.shape[:2], np.uint8)
+    alpha[8:24, 8:32] = 255
+    icon[alpha == 0] = rng.integers(0, 255, (int((alpha == 0).sum()), 3), dtype=np.uint8)
+    write(tmp_path / 'icon.png', np.dstack([icon, alpha]))
+
+    template = TemplateRegistry(tmp_path)['icon.png']
+    assert match_image(img, template.img) is None  # background doesn't match without the mask
+    assert match_image(img, template) == (60, 40, 40, 32)
+    assert match_image(img, template, pyramid=2) == (60, 40, 40, 32)
+    assert match_image(np.zeros_like(img), template) is None
+
+
+def test_02_glob_watch(tmp_path):
+    write(tmp_path / 'pots/hp.png', np.zeros((4, 4, 3), np.uint8))
+    registry = TemplateRegistry(tmp_path)
+    assert [t.path.name for t in registry.glob('pots')] == ['hp.png']
+    assert registry.watcher
+
+    write(tmp_path / 'pots/mana.png', np.zeros((4, 4, 3), np.uint8))
+    for _ in range(100):
+        if len(registry.glob('pots')) == 2:
+            break
+        time.sleep(0.01)
+    assert [t.path.name for t in registry.glob('pots')] == ['hp.png', 'mana.png']
+
+    watcher = registry.watcher
+    registry.close()
+    assert not watcher.is_alive()
+    assert not registry.watcher
+    assert not registry.listings
+    assert len(registry.glob('pots')) == 2  # still listed, without the cache
@@ -1,6 +1,12 @@
+import json
 import time
 
-from capture.utils import spell
+import numpy as np
+import pytest
+
+from capture.common import crop
+from capture.types import Rect
+from capture.utils import EventRing, Histogram, dtime, hist_bucket, hist_value, metrics, spell
 
 
 def test_01_ctx(ctx):
@@ -26,3 +32,237 @@ def test_02_ctx_time(ctx):
     with ctx.mock_all():
         assert c1()
         assert not c2()
+
+
+def test_03_crop_bgrx_view(ctx):
+    full = np.arange(4 * 6 * 4, dtype=np.uint8).reshape(4, 6, 4)
+    full.setflags(write=False)
+
+    cropped = crop(full, (1, 1, 4, 3))
+    assert cropped.shape == (2, 3, 3)
+    assert cropped.flags.c_contiguous
+    assert (cropped == full[1:3, 1:4, :3]).all()
+
+    ctx.frame(full)
+    assert not ctx.overlay
+    ctx.overlay.rect((0, 0, 2, 2))
+    rendered = ctx.render()
+    assert rendered.shape == (4, 6, 3)
+    assert rendered.flags.writeable
+
+
+def test_04_detector_graph(ctx):
+    from capture.common import DetectorGraph
+
+    order = []
+
+    def check(name, ret):
+        def _inner(full):
+            order.append(name)
+            return ret
+
+        return _inner
+
+    graph = (
+        DetectorGraph(workers=2)
+        .add('a', check('a', True))
+        .add('b', check('b', False))
+        .add('c', check('c', 1), deps=['a', 'b'], when=lambda res: res['a'])
+        .add('d', check('d', 2), deps=['b'], when=lambda res: res['b'])
+    )
+    full = np.zeros((2, 2, 4), dtype=np.uint8)
+    ctx.frame(full)
+    res = graph.run(full)
+
+    assert res == {'a': True, 'b': False, 'c': 1}
+    assert order[-1] == 'c'
+    assert set(ctx.c['timings']) == {'a', 'b', 'c'}
+
+    graph.close()
+    with pytest.raises(RuntimeError):
+        graph.run(full)
+
+
+def test_05_frame_cache(ctx):
+    calls = []
+
+    def bw(img):
+        calls.append(img.shape)
+        return img > 100
+
+    full = np.random.default_rng(0).integers(0, 255, (50, 60, 4), dtype=np.uint8)
+    ctx.frame(full)
+    a = ctx.derive(full, (10, 5, 30, 25), 'bw', bw)
+    b = ctx.derive(full, (10, 5, 30, 25), 'bw', bw)
+    assert a is b
+    assert calls == [(20, 20, 3)]
+    assert ctx.gray(full, (0, 0, 10, 10)) is ctx.gray(full, (0, 0, 10, 10))
+    assert ctx.pyramid(full, (0, 0, 40, 40), 1).shape == (20, 20, 3)
+    assert ctx.derive(full, (0, 0, 10, 10)).flags.c_contiguous
+
+    # other images and next frames are not served from the cache
+    ctx.derive(full.copy(), (10, 5, 30, 25), 'bw', bw)
+    ctx.frame(full)
+    ctx.derive(full, (10, 5, 30, 25), 'bw', bw)
+    assert len(calls) == 3
+
+
+def test_06_wait_for(ctx, monkeypatch):
+    rng = np.random.default_rng(0)
+    template = rng.integers(0, 255, (12, 12, 3), dtype=np.uint8)
+    empty = np.zeros((40, 40, 3), np.uint8)
+    shown = empty.copy()
+    shown[10:22, 5:17] = template
+
+    frames = iter([empty, empty, shown, shown, empty])
+    monkeypatch.setattr(ctx.screenshot_wrapper, 'regions', lambda r: {'wait': next(frames)})
+
+    found = ctx.wait_for(template, (100, 200, 140, 240), timeout=1, poll_hz=1000)
+    assert found
+    assert found.polls == 3
+    assert found.rect[:2] == (105, 210)
+
+    gone = ctx.wait_until_gone(template, (100, 200, 140, 240), timeout=1, poll_hz=1000)
+    assert gone
+    assert gone.polls == 2
+    assert gone.rect is None
+
+    monkeypatch.setattr(ctx.screenshot_wrapper, 'regions', lambda r: {'wait': empty})
+    timeout = ctx.wait_for(template, (0, 0, 40, 40), timeout=0.05, poll_hz=100)
+    assert not timeout
+    assert 0.05 <= timeout.elapsed < 0.5
+
+
+def test_06b_grab_channel_order(ctx, monkeypatch):
+    rng = np.random.default_rng(1)
+    bgr = rng.integers(0, 255, (60, 80, 3), dtype=np.uint8)
+    template = bgr[20:32, 30:46].copy()  # as loaded by cv2.imread
+
+    wrapper = ctx.screenshot_wrapper
+    monkeypatch.setattr(wrapper, 'has_native', False)
+    monkeypatch.setattr(wrapper, 'screenshot', lambda: np.ascontiguousarray(bgr[:, :, ::-1]))
+
+    region = (20, 10, 60, 50)
+    full, part = ctx.grab(), ctx.grab(region)
+    assert np.array_equal(full, bgr)
+    assert np.array_equal(part, full[10:50, 20:60])
+
+    on_full = ctx.wait_for(template, timeout=0, poll_hz=1000)
+    on_region = ctx.wait_for(template, region, timeout=0, poll_hz=1000)
+    assert on_full
+    assert on_region
+    assert on_full.rect == on_region.rect == (30, 20, 16, 12)
+
+    assert Rect(30, 20, 16, 12).box(pad=20, shape=bgr.shape) == (10, 0, 66, 52)
+    assert Rect(70, 5, 16, 12).box(pad=20, shape=bgr.shape) == (50, 0, 80, 37)
+
+
+def test_07_event_ring(ctx, tmp_path):
+    ring = EventRing(capacity=4, action_capacity=2)
+    ctx['time'] = 10.0
+    ring.add('click', 'ctrl', 5, 6, 0.05)
+    for i in range(5):
+        ctx['time'] = 11.0 + i
+        ring.add('timing', 'life', value=i / 1000)
+
+    assert len(ring) == 5  # timings wrap in their own section, the click stays
+    assert ring.count == 6
+    assert ring.lines(last=2) == ['life time: 0.003', 'life time: 0.004']
+    assert len(ring.recent(seconds=1.5)) == 2
+
+    ctx['time'] = 16.0
+    ring.add('hotkey', 'f1')
+    ring.add('click')
+    assert ring.lines(kinds=('click',)) == ['click: 0.00s <= 16.000']
+    assert ring.lines(kinds=('hotkey',), last=1) == ['hotkey: f1 <= 16.000']
+    assert ring.recent(kinds=('click', 'hotkey'))['name'].tolist() == [ring.name_id('f1'), 0]
+
+    assert ring.dump(tmp_path / 'events.log', seconds=60) == 6
+    assert (tmp_path / 'events.log').read_text().splitlines()[0].endswith('life time: 0.001')
+    ring.dump(tmp_path / 'events.npy')
+    assert np.load(tmp_path / 'events.npy')['t'][-1] == 16
+    ctx.c.pop('time')
+
+
+def test_08_lazy_debug(ctx):
+    ctx.reset()
+    ctx.frame(None)
+    ctx.d('plain')
+    ctx.d('mp: %.2f', 0.456)
+    ctx.add_timing('check', 0.0123)
+    with ctx.mock_gui():
+        ctx.gui.click(1, 2, modifier='ctrl')
+        assert ctx.gui_calls[-1].startswith('click: 1,2 +ctrl 0.02s')
+    assert ctx.dbg == ['plain', 'mp: 0.46', 'check time: 0.012']
+
+
+def test_09_histogram():
+    for us in (0, 31, 32, 33, 1000, 123456, 2**35):
+        idx = hist_bucket(us)
+        assert hist_value(idx) <= us < hist_value(idx + 1)
+
+    hist = Histogram()
+    for ms in range(1, 101):
+        hist.record(ms / 1000)
+    summary = hist.summary(elapsed=2)
+    assert summary['count'] == 100
+    assert summary['per_sec'] == 50
+    assert abs(summary['p50_ms'] - 50) < 50 * 0.07
+    assert abs(summary['p99_ms'] - 99) < 99 * 0.07
+    assert summary['max_ms'] == 100
+
+
+def test_10_metrics(ctx, tmp_path):
+    metrics.disable()
+
+    @dtime('check')
+    def check():
+        return 1
+
+    check()
+    assert not metrics.histograms
+
+    metrics.enable(export_to=None)
+    try:
+        check()
+        ctx.gui.mocked = True
+        ctx.gui.click(1, 2)
+        metrics.count('frames', 2)
+        path = tmp_path / 'metrics.jsonl'
+        metrics.export(str(path))
+    finally:
+        ctx.gui.mocked = False
+        metrics.disable()
+
+    data = json.loads(path.read_text())
+    assert data['counters']['frames']['count'] == 2
+    assert data['histograms']['detector.check']['count'] == 1
+    assert data['histograms']['input.click']['count'] == 1
+    assert {'p50_ms', 'p95_ms', 'p99_ms', 'per_sec'} <= set(data['histograms']['input.click'])
+    assert not metrics.histograms  # window restarts after export
+
+
+def test_10b_metrics_exporter(tmp_path):
+    first, second = tmp_path / 'a.jsonl', tmp_path / 'b.jsonl'
+
+    def exported(path):
+        lines = path.read_text().splitlines() if path.exists() else []
+        return sum(json.loads(line)['counters'].get('frames', {}).get('count', 0) for line in lines)
+
+    metrics.enable(export_to=str(first), interval=0.01)
+    try:
+        exporter = metrics.exporter
+        metrics.enable(export_to=str(second), interval=0.01)
+        assert not exporter.is_alive()
+        assert metrics.exporter is not exporter
+        metrics.count('frames')
+        deadline = time.monotonic() + 5
+        while not exported(second) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        exporter = metrics.exporter
+        metrics.disable()
+    assert not exporter.is_alive()
+    assert metrics.exporter is None
+    assert exported(second) == 1
+    assert exported(first) == 0
@@ -1,15 +1,27 @@
-from typing import NamedTuple
+from typing import NamedTuple, Tuple
 
 import numpy as np
 import numpy.typing as npt
 
 
+# (x0, y0, x1, y1) area of the screen, regions and crops use it, matches return Rect
+Box = Tuple[int, int, int, int]
+
+
 class Rect(NamedTuple):
     x: int
     y: int
     w: int
     h: int
 
+    def box(self, pad: int = 0, shape=None) -> Box:
+        """(x0, y0, x1, y1) grown by pad, clipped to the image shape (h, w, ...)"""
+        x0, y0 = max(self.x - pad, 0), max(self.y - pad, 0)
+        x1, y1 = self.x + self.w + pad, self.y + self.h + pad
+        if shape is not None:
+            x1, y1 = min(x1, shape[1]), min(y1, shape[0])
+        return x0, y0, x1, y1
+
     def overlap(self, r: 'Rect') -> float:
         """
         returns overlap percentage
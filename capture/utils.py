@@ -1,20 +1,30 @@
+import asyncio
+import concurrent.futures
+import json
 import logging
+import os
+import socket
 import sys
+import threading
 import time
-from collections import defaultdict, deque
+from collections import defaultdict
 from contextlib import contextmanager
 from contextvars import ContextVar
+from dataclasses import dataclass
 from enum import IntEnum
 from functools import wraps
-from subprocess import run
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, Sequence
 
+import cv2
 import numpy as np
 import pyautogui
 from fan_tools.unix import succ
 from PIL.ImageGrab import grab
 
-from capture.cv import match_image, match_many
-from capture.types import Img, Rect
+from capture.cv import DebugOverlay, LocationPrior, match_image, match_many
+from capture.input import MODIFIERS, InputSequence, MockInput, get_backend, set_backend
+from capture.types import Box, Img, Rect
 
 
 log = logging.getLogger(__name__)
@@ -71,33 +81,209 @@ def spell(cooldown=0.1, cast_time=0):
     return _inner
 
 
+HIST_SUB_BITS = 4  # 16 linear sub-buckets per power of two, ~6% worst case error
+HIST_SUB = 1 << HIST_SUB_BITS
+HIST_BUCKETS = 40 * HIST_SUB  # up to ~2**39us
+PERCENTILES = (50, 95, 99)
+METRICS_INTERVAL = 10.0
+METRICS_EXPORT = os.environ.get('CAPTURE_METRICS')  # file path or unix:/socket/path
+
+
+def hist_bucket(us: int) -> int:
+    if us < 2 * HIST_SUB:
+        return max(us, 0)
+    shift = us.bit_length() - HIST_SUB_BITS - 1
+    return min((shift + 1) * HIST_SUB + (us >> shift) - HIST_SUB, HIST_BUCKETS - 1)
+
+
+def hist_value(idx: int) -> int:
+    """lowest value of a bucket, us"""
+    if idx < 2 * HIST_SUB:
+        return idx
+    shift = idx // HIST_SUB - 1
+    return (idx - shift * HIST_SUB) << shift
+
+
+class Histogram:
+    """
+    HDR-style latency histogram: log-linear buckets of microseconds, fixed memory,
+    recording is an index computation and an increment
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(HIST_BUCKETS, np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[hist_bucket(int(seconds * 1e6))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p) -> float:
+        """seconds, bucket midpoint"""
+        if not self.count:
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(self.counts), self.count * p / 100))
+        return (hist_value(idx) + hist_value(idx + 1)) / 2 / 1e6
+
+    def summary(self, elapsed) -> dict:
+        out = {
+            'count': self.count,
+            'per_sec': self.count / elapsed if elapsed else 0.0,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'max_ms': self.max * 1000,
+        }
+        for p in PERCENTILES:
+            out[f'p{p}_ms'] = self.percentile(p) * 1000
+        return out
+
+
+class Metrics:
+    """
+    named counters and latency histograms, off by default: disabled calls return right away
+    summaries cover the window since the previous export
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.exporter: threading.Thread | None = None
+        self.stop_export = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self._swap()
+
+    def _swap(self):
+        """new window, caller holds the lock"""
+        self.counters: dict[str, int] = defaultdict(int)
+        self.histograms: dict[str, Histogram] = {}
+        self.started = time.monotonic()
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.record(seconds)
+
+    def summary(self, reset=False) -> dict:
+        """reset: start a new window in the same locked step, no observation is lost"""
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            counters, histograms = self.counters, self.histograms
+            if reset:
+                self._swap()
+        return {
+            'time': time.time(),
+            'elapsed': elapsed,
+            'counters': {
+                name: {'count': n, 'per_sec': n / elapsed if elapsed else 0.0}
+                for name, n in sorted(counters.items())
+            },
+            'histograms': {
+                name: hist.summary(elapsed) for name, hist in sorted(histograms.items())
+            },
+        }
+
+    def enable(self, export_to=METRICS_EXPORT, interval=METRICS_INTERVAL):
+        """
+        export_to: json lines appended to a file, or datagrams to unix:/path
+        a running exporter is replaced, None keeps metrics in memory only
+        """
+        self.stop_exporter()
+        self.reset()
+        self.enabled = True
+        if export_to:
+            self.stop_export = threading.Event()
+            self.exporter = threading.Thread(
+                target=self._export_loop,
+                args=(export_to, interval, self.stop_export),
+                name='metrics',
+                daemon=True,
+            )
+            self.exporter.start()
+
+    def disable(self):
+        self.enabled = False
+        self.stop_exporter()
+
+    def stop_exporter(self):
+        if self.exporter is not None:
+            self.stop_export.set()
+            self.exporter.join()
+            self.exporter = None
+
+    def export(self, target):
+        data = json.dumps(self.summary(reset=True))
+        if target.startswith('unix:'):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.sendto(data.encode(), target[len('unix:') :])
+        else:
+            with open(target, 'a') as f:
+                f.write(data + '\n')
+
+    def _export_loop(self, target, interval, stop: threading.Event):
+        while not stop.wait(interval):
+            try:
+                self.export(target)
+            except OSError as e:
+                log.warning(f'Metrics export to {target} failed: {e}')
+
+
+metrics = Metrics()
+
+
+def timed(name):
+    """like dtime, into metrics histograms only: for calls outside of frame processing"""
+
+    def _inner(func):
+        @wraps(func)
+        def ret(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - t)
+
+        return ret
+
+    return _inner
+
+
 class Key(IntEnum):
-    L_CTRL = 29
-    L_SHIFT = 42
-    L_ALT = 56
+    L_CTRL = MODIFIERS['ctrl']
+    L_SHIFT = MODIFIERS['shift']
+    L_ALT = MODIFIERS['alt']
 
 
 @contextmanager
 def hold(key):
-    key_map = {
-        'ctrl': Key.L_CTRL,
-        'shift': Key.L_SHIFT,
-        'alt': Key.L_ALT,
-    }
-    key_code = key_map[key]
-
-    # Press key down
-    run(['ydotool', 'key', f'{key_code}:1'])
-    try:
+    with get_backend().hold(MODIFIERS[key]):
         yield
-    finally:
-        # Release key
-        run(['ydotool', 'key', f'{key_code}:0'])
 
 
 class ScreenshotWrapper:
+    output = 'DP-2'
+
     def __init__(self):
         self.has_native = False
+        self._capturer = None
         try:
             import system_bridge
 
@@ -106,56 +292,127 @@ class ScreenshotWrapper:
         except ImportError:
             pass
 
+    @property
+    def capturer(self):
+        """
+        persistent native capturer, wayland session is kept between frames
+        """
+        if self._capturer is None:
+            self._capturer = self.system_bridge.Capturer(self.output)
+        return self._capturer
+
+    @timed('capture')
     def screenshot(self):
         log.debug('Do screenshot')
         if self.has_native:
-            return self.system_bridge.capture('DP-2')
+            return self.capturer.capture()
         full_img = grab()
         second_screen = full_img.crop((2560, 0, 5120, 1440))
         return np.array(second_screen)
 
+    def view(self) -> Img:
+        """
+        BGR(X) frame for handlers. native capture returns read-only view of the shm buffer,
+        it stays valid while referenced. use `crop` to get BGR copies of the regions
+        """
+        if self.has_native:
+            return self._native_view()
+        return np.ascontiguousarray(self.screenshot()[:, :, ::-1])  # timed in screenshot
+
+    @timed('capture')
+    def _native_view(self) -> Img:
+        return self.capturer.capture_view()
+
+    @contextmanager
+    def stream(self, fps=60, regions: list[Box] | None = None, seconds: float | None = None):
+        """
+        iterate over the newest frames: (BGR(X) frame, timestamp ns, dropped frames, damage)
+        native capture runs on a background thread, so capture overlaps with processing
+        with regions frames are delivered only when pixels in the regions change
+        damage: [(x, y, w, h), ...] changed since previous frame, None if unknown
+        seconds: iteration stops after, also on a static screen that yields nothing
+        timestamps are CLOCK_MONOTONIC ns
+        """
+        if not self.has_native:
+            yield self._poll_frames(fps, regions, seconds)
+            return
+
+        frames = self.capturer.stream(fps, regions=regions or None, seconds=seconds)
+        try:
+            yield frames
+        finally:
+            frames.stop()
+
+    def _poll_frames(self, fps, regions=None, seconds=None):
+        interval = 1 / fps
+        end = None if seconds is None else time.monotonic_ns() + int(seconds * 1e9)
+        prev = None
+        while True:
+            t = time.monotonic_ns()
+            if end is not None and t >= end:
+                return
+            full = self.view()
+            crops = [full[y0:y1, x0:x1] for x0, y0, x1, y1 in regions or []]
+            if prev is None or not all(np.array_equal(a, b) for a, b in zip(crops, prev)):
+                prev = crops
+                yield full, t, 0, None
+            time.sleep(max(0, interval - (time.monotonic_ns() - t) / 1e9))
+
+    @timed('capture.regions')
+    def regions(self, regions: dict[str, Box]) -> dict[str, Img]:
+        """
+        capture only the regions: {name: (x0, y0, x1, y1)} => {name: BGR image}
+        """
+        if self.has_native:
+            return self.capturer.capture_regions(regions)
+        full = self.view()
+        return {
+            name: np.ascontiguousarray(full[y0:y1, x0:x1, :3])
+            for name, (x0, y0, x1, y1) in regions.items()
+        }
+
 
 class GuiWrapper:
     def __init__(self):
         self.mocked = False
         self.reset()
 
+    @timed('input.hotkey')
     def hotkey(self, *args, **kwargs):
         if self.mocked:
-            self.gui_calls.append(['hotkey', args, kwargs, ctx.time()])
+            ctx.events.add('hotkey', '+'.join(args))
             return True
         if not self.can_click:
             ctx.d('cannot click')
             return False
-        self.gui_calls.append(['hotkey', args, kwargs, ctx.time()])
+        ctx.events.add('hotkey', '+'.join(args))
         pyautogui.hotkey(*args, **kwargs)
         return True
 
+    @timed('input.mousemove')
     def mousemove(self, x: int, y: int):
-        # ydotool specific, everything must be divided by 2 (2560, 720) -> right-down corner
-        # 1280, 0 - second monitor top
-        # + we capture only second monitor
-        x_str = str((x + 2560) / 2)
-        y_str = str(y / 2)
-        log.info(f'Click to {x_str}, {y_str}')
-        run(['ydotool', 'mousemove', '-a', x_str, y_str])
-
-    def click(self, x=None, y=None, duration=0.02):
+        # ydotool specific, see capture.input.to_ydotool
+        log.info(f'Move to {x}, {y}')
+        get_backend().mousemove(x, y)
+
+    @timed('input.click')
+    def click(self, x=None, y=None, duration=0.02, modifier=None):
+        """modifier: ctrl, shift or alt held around move and click, sent as one sequence"""
         if self.mocked:
-            self.gui_calls.append(['click', {'x': x, 'y': y, 'duration': duration}, ctx.time()])
+            ctx.events.add('click', modifier or '', x, y, duration)
             return True
         if not self.can_click:
             return False
-        self.gui_calls.append(['click', {'x': x, 'y': y, 'duration': duration}, ctx.time()])
-        if x is not None and y is not None:
-            self.mousemove(x, y)
-            if duration:
-                time.sleep(duration)
-        run(['ydotool', 'click', '0xC0'])
+        ctx.events.add('click', modifier or '', x, y, duration)
+        get_backend().click(x, y, duration, modifier)
         return True
 
+    @property
+    def gui_calls(self):
+        """last actions, formatted on read"""
+        return ctx.events.lines(kinds=ACTION_KINDS, last=GUI_CALLS_SHOWN)
+
     def reset(self):
-        self.gui_calls = deque(maxlen=15)
         self.win_delay = 0.4
         self.last_win = ''
         self.last_win_call = 0
@@ -180,10 +437,157 @@ class GuiWrapper:
 
     @contextmanager
     def mock(self):
+        """actions are only logged, macros and direct backend input go to MockInput"""
         self.mocked = True
-        yield
-        self.reset()
-        self.mocked = False
+        prev = set_backend(MockInput())
+        try:
+            yield
+        finally:
+            set_backend(prev)
+            self.reset()
+            ctx.events.clear()
+            self.mocked = False
+
+
+GUARD_INTERVAL = 0.1  # how often cancel_if is polled during macro waits
+
+
+@dataclass
+class Move:
+    x: int
+    y: int
+
+    async def run(self, backend):
+        backend.mousemove(self.x, self.y)
+
+
+@dataclass
+class Click:
+    x: Optional[int] = None
+    y: Optional[int] = None
+    duration: float = 0.02  # between move and click
+
+    async def run(self, backend):
+        if self.x is not None and self.y is not None:
+            backend.mousemove(self.x, self.y)
+            await asyncio.sleep(self.duration)
+        backend.run(InputSequence().click())
+
+
+@dataclass
+class Hotkey:
+    keys: Sequence[str]
+
+    async def run(self, backend):
+        await asyncio.to_thread(ctx.gui.hotkey, *self.keys)
+
+
+@dataclass
+class Hold:
+    """modifier down, released by Release or when the macro ends or is cancelled"""
+
+    key: str
+
+    async def run(self, backend):
+        backend.run(InputSequence().press(MODIFIERS[self.key]))
+
+
+@dataclass
+class Release:
+    key: str
+
+    async def run(self, backend):
+        backend.run(InputSequence().release(MODIFIERS[self.key]))
+
+
+@dataclass
+class Wait:
+    seconds: float
+
+
+class ActionScheduler:
+    """
+    macros (lists of actions) run on a dedicated asyncio loop thread, one at a time in order
+    submit() returns a future at once, so the caller keeps watching the screen
+    cancel_if is polled between actions and during waits, macro stops when it returns true
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.lock = threading.Lock()
+        self.futures = set()
+        self.running = asyncio.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='actions', daemon=True).start()
+
+    def submit(
+        self, actions, cancel_if: Callable[[], bool] | None = None, preempt=False
+    ) -> concurrent.futures.Future:
+        """future result: True when all actions ran, False when stopped by cancel_if"""
+        self.start()
+        if preempt:
+            self.cancel()
+        future = asyncio.run_coroutine_threadsafe(self.run(list(actions), cancel_if), self.loop)
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    def cancel(self):
+        """cancel running and queued macros"""
+        for future in list(self.futures):
+            future.cancel()
+
+    async def guard(self, cancel_if):
+        return bool(cancel_if) and bool(await asyncio.to_thread(cancel_if))
+
+    async def sleep(self, seconds, cancel_if) -> bool:
+        """False when cancel_if fired"""
+        end = time.monotonic() + seconds
+        while (left := end - time.monotonic()) > 0:
+            await asyncio.sleep(min(left, GUARD_INTERVAL) if cancel_if else left)
+            if await self.guard(cancel_if):
+                return False
+        return True
+
+    @staticmethod
+    def log(action):
+        """same rows as GuiWrapper, Hotkey is logged by ctx.gui.hotkey"""
+        if isinstance(action, Click):
+            ctx.events.add('click', '', action.x, action.y, action.duration)
+        elif isinstance(action, (Hold, Release)):
+            state = 'down' if isinstance(action, Hold) else 'up'
+            ctx.events.add('hotkey', f'{action.key} {state}')
+
+    async def run(self, actions, cancel_if) -> bool:
+        async with self.running:
+            backend = get_backend()
+            held = []
+            try:
+                for action in actions:
+                    if isinstance(action, Wait):
+                        if not await self.sleep(action.seconds, cancel_if):
+                            return False
+                        continue
+                    if await self.guard(cancel_if):
+                        return False
+                    t = time.perf_counter()
+                    await action.run(backend)
+                    self.log(action)
+                    if metrics.enabled:
+                        name = f'input.{type(action).__name__.lower()}'
+                        metrics.observe(name, time.perf_counter() - t)
+                    if isinstance(action, Hold):
+                        held.append(action.key)
+                    elif isinstance(action, Release) and action.key in held:
+                        held.remove(action.key)
+                return True
+            finally:
+                for key in reversed(held):
+                    backend.run(InputSequence().release(MODIFIERS[key]))
 
 
 class ClickOnResp:
@@ -195,12 +599,191 @@ class ClickOnResp:
         return self.result
 
 
+class WaitResult(NamedTuple):
+    """truthy when the awaited state was reached, rect is in screen coords"""
+
+    ok: bool
+    rect: Rect | None
+    elapsed: float
+    polls: int
+
+    def __bool__(self):
+        return self.ok
+
+
+EVENT_DTYPE = np.dtype(
+    [
+        ('t', '<f8'),  # ctx.time()
+        ('frame', '<i4'),
+        ('kind', 'u1'),  # EVENT_KINDS index
+        ('name', '<u2'),  # EventRing.names index
+        ('x', '<i4'),
+        ('y', '<i4'),
+        ('value', '<f4'),
+    ]
+)
+EVENT_KINDS = ('click', 'hotkey', 'timing')
+ACTION_KINDS = ('click', 'hotkey')
+EVENT_SECTIONS = (ACTION_KINDS, ('timing',))  # kinds sharing a ring section
+ACTION_CAPACITY = 1024  # actions keep their own section, timings don't push them out
+EVENT_CAPACITY = 64 * 1024  # ~30s of per-detector timings at 60 fps
+GUI_CALLS_SHOWN = 15
+NO_POS = -1
+
+
+class EventRing:
+    """
+    preallocated log of recent actions and timing samples, rows are overwritten in place
+    each section of the array is a ring for its own kinds, see EVENT_SECTIONS
+    names are interned to ids, so adding does no formatting, reading formats
+    """
+
+    def __init__(self, capacity=EVENT_CAPACITY, action_capacity=ACTION_CAPACITY):
+        sizes = (action_capacity, capacity)
+        self.rows = np.zeros(sum(sizes), EVENT_DTYPE)
+        self.columns = {name: self.rows[name] for name in EVENT_DTYPE.names}
+        self.starts = (0, action_capacity)
+        self.sizes = sizes
+        self.counts = [0] * len(sizes)  # total added per section
+        self.section = {kind: i for i, kinds in enumerate(EVENT_SECTIONS) for kind in kinds}
+        self.names = ['']
+        self.name_ids = {'': 0}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(min(count, size) for count, size in zip(self.counts, self.sizes))
+
+    @property
+    def count(self):
+        """total added"""
+        return sum(self.counts)
+
+    def name_id(self, name) -> int:
+        idx = self.name_ids.get(name)
+        if idx is None:
+            with self.lock:
+                if (idx := self.name_ids.get(name)) is None:
+                    idx = self.name_ids[name] = len(self.names)
+                    self.names.append(name)
+        return idx
+
+    def add(self, kind, name='', x=None, y=None, value=0.0):
+        section = self.section[kind]
+        kind = EVENT_KINDS.index(kind)
+        name = self.name_id(name)
+        t = ctx.time()
+        frame = ctx.c.get('f_count', 0)
+        c = self.columns
+        with self.lock:
+            count = self.counts[section]
+            self.counts[section] = count + 1
+            i = self.starts[section] + count % self.sizes[section]
+            c['t'][i] = t
+            c['frame'][i] = frame
+            c['kind'][i] = kind
+            c['name'][i] = name
+            c['x'][i] = NO_POS if x is None else x
+            c['y'][i] = NO_POS if y is None else y
+            c['value'][i] = value
+
+    def clear(self):
+        with self.lock:
+            self.counts = [0] * len(self.sizes)
+
+    def _newest(self, section, n) -> np.ndarray:
+        """copy of the newest n rows of a section, oldest first, caller holds the lock"""
+        count, size = self.counts[section], self.sizes[section]
+        n = min(n, count, size)
+        idx = np.arange(count - n, count) % size
+        return self.rows[idx + self.starts[section]]
+
+    def _section(self, section, kinds, last=None) -> np.ndarray:
+        """walks back from the newest row until last rows of kinds are found"""
+        available = min(self.counts[section], self.sizes[section])
+        mixed = not set(EVENT_SECTIONS[section]) <= kinds
+        n = available if last is None else min(last, available)
+        while True:
+            with self.lock:
+                rows = self._newest(section, n)
+            if mixed:
+                rows = rows[np.isin(rows['kind'], [EVENT_KINDS.index(k) for k in kinds])]
+            if last is None or len(rows) >= last or n >= available:
+                return rows if last is None else rows[-last:]
+            n = min(n * 4, available)
+
+    def recent(self, seconds=None, last=None, kinds=None) -> np.ndarray:
+        """copy of rows, oldest first. last reads only the newest rows of the sections"""
+        kinds = set(EVENT_KINDS if kinds is None else kinds)
+        sections = sorted({self.section[kind] for kind in kinds})
+        parts = [self._section(s, kinds, None if seconds is not None else last) for s in sections]
+        rows = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        if len(parts) > 1:
+            rows = rows[np.argsort(rows['t'], kind='stable')]
+        if seconds is not None and len(rows):
+            rows = rows[rows['t'] >= rows['t'][-1] - seconds]
+        if last is not None:
+            rows = rows[-last:]
+        return rows
+
+    def format(self, row) -> str:
+        kind, name = EVENT_KINDS[row['kind']], self.names[row['name']]
+        if kind == 'timing':
+            return f'{name} time: {row["value"]:.3f}'
+        if kind == 'hotkey':
+            return f'hotkey: {name} <= {row["t"]:.3f}'
+        pos = '' if row['x'] == NO_POS else f' {row["x"]},{row["y"]}'
+        modifier = f' +{name}' if name else ''
+        return f'click:{pos}{modifier} {row["value"]:.2f}s <= {row["t"]:.3f}'
+
+    def lines(self, **kwargs) -> list[str]:
+        return [self.format(row) for row in self.recent(**kwargs)]
+
+    def dump(self, path: Path, seconds=None) -> int:
+        """last seconds of events: .npy keeps raw rows, anything else is a text log"""
+        path = Path(path)
+        rows = self.recent(seconds)
+        if path.suffix == '.npy':
+            np.save(path, rows)
+        else:
+            path.write_text(
+                ''.join(f'{r["t"]:.3f}\t{r["frame"]}\t{self.format(r)}\n' for r in rows)
+            )
+        return len(rows)
+
+
+class FrameCache:
+    """
+    derived images of one frame, computed at most once per (region, transform)
+    Context.frame() starts a new cache, so the previous frame's images are freed
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, make):
+        if key in self.items:
+            return self.items[key]
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:  # detectors run concurrently, only one computes
+            if key not in self.items:
+                self.items[key] = make()
+        return self.items[key]
+
+    def __len__(self):
+        return len(self.items)
+
+
 class Context(dict):
     def __init__(self):
         if not hasattr(sys, '_ctx_inner'):  # survive ipython's autoreload
             sys._ctx_inner = ContextVar('ctx', default={'gui': GuiWrapper(), 'frame_time': None})
         self.inner = sys._ctx_inner
         self.screenshot_wrapper = ScreenshotWrapper()
+        self.actions = ActionScheduler()
+        self.events = EventRing()
         self.reset()
 
     def crop_position(self, size) -> tuple[int, int, int, int]:
@@ -217,26 +800,83 @@ class Context(dict):
         global _NEXT_CAST
         _NEXT_CAST = 0
         self.c.update(
-            {'f_count': 0, 'f_img': None, 'f_debug': None, 'f': defaultdict(float), 'debug': []}
+            {
+                'f_count': 0,
+                'f_img': None,
+                'overlay': DebugOverlay(),
+                'f': defaultdict(float),
+                'debug': [],
+                'timings': {},
+                'f_cache': FrameCache(),
+            }
         )
-        self.remembered = {}
+        self.prior = LocationPrior()
 
     def frame(self, img, delta=1):
         self.c['f_count'] += 1
         self.c['f_img'] = img
-        self.c['f_debug'] = img.copy()  # debug frame, draw here
-        self.c['debug'] = []
+        self.c['overlay'] = DebugOverlay()  # debug drawing, rendered on request only
+        self.c['debug'].clear()
+        self.c['timings'] = {}
+        self.c['f_cache'] = FrameCache()
+
+    def d(self, msg, *args):
+        """debug line for the current frame, msg % args is formatted only when shown"""
+        self.c['debug'].append((msg, args) if args else msg)
+
+    def add_timing(self, name, spent):
+        """per-frame timing of a check, in seconds"""
+        self.c['timings'][name] = spent
+        self.events.add('timing', name, value=spent)
+        if metrics.enabled:
+            metrics.observe(f'detector.{name}', spent)
+
+    def derive(self, full: Img, pos: Box, key=None, fn=None) -> Img:
+        """
+        BGR crop of pos, transformed by fn(crop), memoized for the current frame by (pos, key)
+        only the frame passed to frame() is cached, results are shared: treat them read-only
+        """
+
+        def make():
+            img = np.ascontiguousarray(full[pos[1] : pos[3], pos[0] : pos[2], :3])
+            return fn(img) if fn else img
+
+        if full is not self.c.get('f_img'):
+            return make()
+        return self.c['f_cache'].get((tuple(pos), key), make)
+
+    def gray(self, full: Img, pos: Box) -> Img:
+        return self.derive(full, pos, 'gray', lambda img: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+
+    def pyramid(self, full: Img, pos: Box, level: int) -> Img:
+        scale = 1 / 2**level
+        return self.derive(
+            full,
+            pos,
+            ('pyramid', level),
+            lambda img: cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA),
+        )
 
-    def d(self, msg):
-        self.c['debug'].append(msg)
+    def in_range(self, full: Img, pos: Box, lower, upper) -> Img:
+        lower, upper = tuple(lower), tuple(upper)
+        return self.derive(
+            full, pos, ('in_range', lower, upper), lambda img: cv2.inRange(img, lower, upper)
+        )
 
     @property
-    def df(self):
-        return self.c['f_debug']
+    def overlay(self) -> DebugOverlay:
+        return self.c['overlay']
+
+    def render(self) -> Img | None:
+        """current frame with the overlay drawn, for debug windows and recordings"""
+        if self.c['f_img'] is None:
+            return None
+        return self.overlay.render(self.c['f_img'])
 
     @property
-    def dbg(self):
-        return self.c['debug']
+    def dbg(self) -> list[str]:
+        lines = [msg if isinstance(msg, str) else msg[0] % msg[1] for msg in self.c['debug']]
+        return lines + [f'{name} time: {spent:.3f}' for name, spent in self.c['timings'].items()]
 
     @property
     def f_count(self):
@@ -260,9 +900,6 @@ class Context(dict):
     def gui(self) -> GuiWrapper:
         return self.c['gui']
 
-    def add_hotkey(self, *args):
-        self.c.get('gui_calls', {}).append(f'hotkey: {args} <= {ctx.time()}')
-
     @property
     def gui_calls(self):
         return self.gui.gui_calls
@@ -276,7 +913,6 @@ class Context(dict):
     def c_dbg(self):
         c_copy = self.c.copy()
         c_copy.pop('f_img')
-        c_copy.pop('f_debug')
         return c_copy
 
     @contextmanager
@@ -289,6 +925,15 @@ class Context(dict):
         log.debug('Unmock time')
         self.c['frame_time'] = False
 
+    @property
+    def headless(self):
+        return self.c.get('headless', False)
+
+    def show(self, name, img):
+        """cv2.imshow unless running headless (benchmarks, replays)"""
+        if not self.headless:
+            cv2.imshow(name, img)
+
     @contextmanager
     def mock_all(self, fps=60):
         with self.mock_gui(), self.mock_time(fps):
@@ -306,6 +951,9 @@ class Context(dict):
     def screenshot(self):
         return self.screenshot_wrapper.screenshot()
 
+    def screenshot_regions(self, regions: dict[str, Box]) -> dict[str, Img]:
+        return self.screenshot_wrapper.regions(regions)
+
     def click_on(
         self,
         template: Img,
@@ -317,62 +965,108 @@ class Context(dict):
         full_screen: Img | None = None,
         remember=False,
         position=None,
+        pyramid=0,
     ) -> ClickOnResp:
+        """
+        pyramid: coarse-to-fine match levels, see match_image
+        remember: search around the last match first, see LocationPrior
+        """
         full_screen = None
-        template_hash = hash(template.data.tobytes())
-        if remember and template_hash in self.remembered:
-            position = self.remembered[template_hash]
 
         if not position:
             if not full_screen:
                 full_screen = self.screenshot()
                 log.debug(f'{full_screen.shape=}')
 
-            if rect := match_image(full_screen, template):
+            if rect := self.detect(template, pyramid, remember, full_screen):
                 x = rect.x + offset[0]
                 y = rect.y + offset[1]
                 position = (x, y)
-            if remember:
-                self.remembered[template_hash] = position
 
         if position:
             x, y = position
-            if ctrl or shift or alt:
-                modifier = 'ctrl' if ctrl else 'shift' if shift else 'alt'
-                with hold(modifier):
-                    log.debug(f'Click on with {modifier=} to {x}, {y}')
-                    self.gui.click(x, y)
-            else:
-                log.debug(f'Click on to {x}, {y}')
-                self.gui.click(x, y)
+            modifier = 'ctrl' if ctrl else 'shift' if shift else 'alt' if alt else None
+            log.debug(f'Click on with {modifier=} to {x}, {y}')
+            self.gui.click(x, y, modifier=modifier)
             time.sleep(delay)
             return ClickOnResp(True, full_screen)
         return ClickOnResp(False, full_screen)
 
-    def detect_many(self, template: Img) -> list[Rect]:
+    @timed('match.many')
+    def detect_many(self, template: Img) -> np.recarray:
         img = self.screenshot()
         matches = match_many(img, template)
         return matches
 
-    def detect(self, template: Img) -> Rect | None:
-        img = self.screenshot()
-        return match_image(img, template)
+    def grab(self, region: Box | None = None) -> Img:
+        """
+        BGR, like templates from cv2.imread, of the whole screen or only the region (x0, y0, x1, y1)
+        unlike screenshot(), which is RGB
+        """
+        if region is None:
+            return np.ascontiguousarray(self.screenshot_wrapper.view()[:, :, :3])
+        return self.screenshot_regions({'wait': region})['wait']
+
+    def wait_for(
+        self,
+        template: Img,
+        region: Box | None = None,
+        timeout=5.0,
+        poll_hz=60,
+        pyramid=0,
+        gone=False,
+    ) -> WaitResult:
+        """
+        poll region until template shows up (or is gone), instead of a worst case sleep
+        result is falsy on timeout, elapsed tells how long it actually took
+        """
+        start = time.perf_counter()
+        polls = 0
+        while True:
+            polls += 1
+            rect = self.match(self.grab(region), template, pyramid)
+            if rect and region is not None:
+                rect = Rect(rect.x + region[0], rect.y + region[1], rect.w, rect.h)
+            elapsed = time.perf_counter() - start
+            if bool(rect) != gone or elapsed >= timeout:
+                ok = bool(rect) != gone
+                log.debug(f'wait {"gone" if gone else "for"}: {ok=} {elapsed=:.3f} {polls=}')
+                return WaitResult(ok, rect, elapsed, polls)
+            next_poll = start + polls / poll_hz
+            time.sleep(max(0.0, min(next_poll, start + timeout) - time.perf_counter()))
+
+    def wait_until_gone(self, template: Img, region: Box | None = None, timeout=5.0, **kw):
+        return self.wait_for(template, region, timeout, gone=True, **kw)
+
+    def detect(self, template: Img, pyramid=0, remember=False, img=None) -> Rect | None:
+        if img is None:
+            img = self.screenshot()
+        return self.match(img, template, pyramid, remember)
+
+    @timed('match')
+    def match(self, img: Img, template: Img, pyramid=0, remember=False) -> Rect | None:
+        if remember:
+            return self.prior.match(img, template, pyramid=pyramid)
+        return match_image(img, template, pyramid=pyramid)
 
 
 ctx = Context()
 
 
 def dtime(debug_msg=''):
-    """decorator that measures function time and put into context"""
+    """
+    decorator that measures function time and put into context
+    with metrics enabled also into the detector.<debug_msg> histogram
+    """
 
     def _inner(func):
         @wraps(func)
         def ret(*args, **kwargs):
-            t = time.time()
+            t = time.perf_counter()
             try:
                 return func(*args, **kwargs)
             finally:
-                ctx.d(f'{debug_msg} time: {time.time() - t:.3f}')
+                ctx.add_timing(debug_msg, time.perf_counter() - t)
 
         return ret
 
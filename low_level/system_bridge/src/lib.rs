@@ -1,5 +1,6 @@
 mod screenshot;
 mod shortcuts;
+mod stream;
 
 use pyo3::prelude::*;
 
@@ -23,6 +24,8 @@ fn system_bridge(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(capture, m)?)?;
     m.add_function(wrap_pyfunction!(capture_raw, m)?)?;
     m.add_function(wrap_pyfunction!(list_outputs, m)?)?;
+    m.add_class::<screenshot::Capturer>()?;
+    m.add_class::<stream::FrameStream>()?;
     m.add_class::<shortcuts::Shortcuts>()?;
     Ok(())
 }
@@ -1,15 +1,22 @@
 //! Screenshot capture module using Wayland wlr-screencopy protocol
 
-use numpy::ndarray::Array3;
+use numpy::ndarray::{Array3, ArrayView3, ShapeBuilder};
 use numpy::PyArray3;
 use pyo3::prelude::*;
+use pyo3::types::PyDict;
+use std::ffi::c_void;
 use std::os::fd::AsFd;
 use std::os::unix::io::OwnedFd;
+use std::ptr::NonNull;
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::Arc;
 use wayland_client::{
+    backend::WaylandError,
     delegate_noop,
     protocol::{wl_buffer, wl_output, wl_registry, wl_shm, wl_shm_pool},
-    Connection, Dispatch, QueueHandle, WEnum,
+    Connection, Dispatch, EventQueue, Proxy, QueueHandle, WEnum,
 };
+use crate::stream::{extract_boxes, FrameStream, DEFAULT_RING};
 use wayland_protocols_wlr::screencopy::v1::client::{
     zwlr_screencopy_frame_v1, zwlr_screencopy_manager_v1,
 };
@@ -17,6 +24,7 @@ use wayland_protocols_wlr::screencopy::v1::client::{
 struct OutputInfo {
     output: wl_output::WlOutput,
     name: Option<String>,
+    scale: i32,
 }
 
 struct FrameData {
@@ -26,6 +34,28 @@ struct FrameData {
     stride: u32,
     ready: bool,
     failed: bool,
+    // compositor presentation time of the copied content
+    timestamp_ns: u64,
+    // changed areas (x, y, width, height) reported for copy_with_damage
+    damage: Vec<Damage>,
+}
+
+/// Damaged area in buffer pixels: (x, y, width, height)
+pub(crate) type Damage = (i32, i32, i32, i32);
+
+impl FrameData {
+    fn new() -> Self {
+        Self {
+            format: None,
+            width: 0,
+            height: 0,
+            stride: 0,
+            ready: false,
+            failed: false,
+            timestamp_ns: 0,
+            damage: Vec::new(),
+        }
+    }
 }
 
 struct ScreenshotState {
@@ -41,14 +71,7 @@ impl ScreenshotState {
             shm: None,
             screencopy_manager: None,
             outputs: Vec::new(),
-            frame_data: FrameData {
-                format: None,
-                width: 0,
-                height: 0,
-                stride: 0,
-                ready: false,
-                failed: false,
-            },
+            frame_data: FrameData::new(),
         }
     }
 }
@@ -69,7 +92,7 @@ impl Dispatch<wl_registry::WlRegistry, ()> for ScreenshotState {
                 }
                 "wl_output" => {
                     let output = registry.bind::<wl_output::WlOutput, _, _>(name, version.min(4), qh, ());
-                    state.outputs.push(OutputInfo { output, name: None });
+                    state.outputs.push(OutputInfo { output, name: None, scale: 1 });
                 }
                 "zwlr_screencopy_manager_v1" => {
                     state.screencopy_manager = Some(
@@ -93,10 +116,13 @@ impl Dispatch<wl_output::WlOutput, ()> for ScreenshotState {
         _conn: &Connection,
         _qh: &QueueHandle<Self>,
     ) {
-        if let wl_output::Event::Name { name } = event {
-            if let Some(info) = state.outputs.iter_mut().find(|o| o.output == *output) {
-                info.name = Some(name);
-            }
+        let Some(info) = state.outputs.iter_mut().find(|o| o.output == *output) else {
+            return;
+        };
+        match event {
+            wl_output::Event::Name { name } => info.name = Some(name),
+            wl_output::Event::Scale { factor } => info.scale = factor,
+            _ => {}
         }
     }
 }
@@ -122,12 +148,17 @@ impl Dispatch<zwlr_screencopy_frame_v1::ZwlrScreencopyFrameV1, ()> for Screensho
                     }
                 }
             }
-            zwlr_screencopy_frame_v1::Event::Ready { .. } => {
+            zwlr_screencopy_frame_v1::Event::Ready { tv_sec_hi, tv_sec_lo, tv_nsec } => {
+                let secs = ((tv_sec_hi as u64) << 32) | (tv_sec_lo as u64);
+                state.frame_data.timestamp_ns = secs * 1_000_000_000 + tv_nsec as u64;
                 state.frame_data.ready = true;
             }
             zwlr_screencopy_frame_v1::Event::Failed => {
                 state.frame_data.failed = true;
             }
+            zwlr_screencopy_frame_v1::Event::Damage { x, y, width, height } => {
+                state.frame_data.damage.push((x as i32, y as i32, width as i32, height as i32));
+            }
             zwlr_screencopy_frame_v1::Event::Flags { .. } => {}
             _ => {}
         }
@@ -153,113 +184,485 @@ fn create_shm_file(size: usize) -> std::io::Result<OwnedFd> {
     Ok(fd)
 }
 
-fn capture_screenshot_impl(output_name: &str) -> PyResult<(Vec<u8>, u32, u32)> {
-    let conn = Connection::connect_to_env()
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Failed to connect to Wayland: {}", e)))?;
+/// Shared memory buffer the compositor copies frames into
+pub(crate) struct ShmBuffer {
+    _fd: OwnedFd,
+    pool: wl_shm_pool::WlShmPool,
+    buffer: wl_buffer::WlBuffer,
+    mmap: NonNull<c_void>,
+    size: usize,
+    width: u32,
+    height: u32,
+    stride: u32,
+    format: wl_shm::Format,
+}
 
-    let mut event_queue = conn.new_event_queue();
-    let qh = event_queue.handle();
-    let display = conn.display();
+// The mapping is owned by the buffer and only written by the compositor while a copy is pending
+unsafe impl Send for ShmBuffer {}
+unsafe impl Sync for ShmBuffer {}
+
+impl ShmBuffer {
+    fn new(
+        shm: &wl_shm::WlShm,
+        qh: &QueueHandle<ScreenshotState>,
+        width: u32,
+        height: u32,
+        stride: u32,
+        format: wl_shm::Format,
+    ) -> PyResult<Self> {
+        let size = (stride * height) as usize;
+
+        let fd = create_shm_file(size)
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Failed to create shm file: {}", e)))?;
+
+        // Memory map for reading
+        let mmap = unsafe {
+            nix::sys::mman::mmap(
+                None,
+                std::num::NonZeroUsize::new(size).unwrap(),
+                nix::sys::mman::ProtFlags::PROT_READ | nix::sys::mman::ProtFlags::PROT_WRITE,
+                nix::sys::mman::MapFlags::MAP_SHARED,
+                &fd,
+                0,
+            )
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("mmap failed: {}", e)))?
+        };
+
+        let pool = shm.create_pool(fd.as_fd(), size as i32, qh, ());
+        let buffer = pool.create_buffer(0, width as i32, height as i32, stride as i32, format, qh, ());
+
+        Ok(Self { _fd: fd, pool, buffer, mmap, size, width, height, stride, format })
+    }
 
-    let mut state = ScreenshotState::new();
-    display.get_registry(&qh, ());
+    fn matches(&self, frame: &FrameData) -> bool {
+        self.width == frame.width
+            && self.height == frame.height
+            && self.stride == frame.stride
+            && Some(self.format) == frame.format
+    }
+
+    fn data(&self) -> &[u8] {
+        unsafe { std::slice::from_raw_parts(self.mmap.as_ptr() as *const u8, self.size) }
+    }
 
-    // First roundtrip to get globals
-    event_queue.roundtrip(&mut state)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Roundtrip failed: {}", e)))?;
-    // Second roundtrip to get output names
-    event_queue.roundtrip(&mut state)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Roundtrip failed: {}", e)))?;
+    /// Convert to RGB (from BGRX)
+    fn to_rgb(&self) -> Vec<u8> {
+        let row_len = (self.width * 4) as usize;
+        let mut rgb_data = Vec::with_capacity((self.width * self.height * 3) as usize);
 
-    // Check required globals
-    if state.shm.is_none() {
-        return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("wl_shm not available"));
+        for row in self.data().chunks_exact(self.stride as usize) {
+            // XRGB8888/ARGB8888: memory layout is B, G, R, X/A on little-endian
+            for px in row[..row_len].chunks_exact(4) {
+                rgb_data.extend_from_slice(&[px[2], px[1], px[0]]);
+            }
+        }
+        rgb_data
     }
-    if state.screencopy_manager.is_none() {
-        return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("zwlr_screencopy_manager_v1 not available"));
+}
+
+impl ShmBuffer {
+    /// Copy a region as packed 3-channel BGR (or RGB) rows.
+    /// `origin` is the position of the buffer on the output, in pixels.
+    fn copy_region(&self, region: &Region, origin: (i32, i32), rgb: bool) -> Option<Vec<u8>> {
+        let x = region.x0 - origin.0;
+        let y = region.y0 - origin.1;
+        let (width, height) = (region.width(), region.height());
+        if x < 0 || y < 0 || x + width > self.width as i32 || y + height > self.height as i32 {
+            return None;
+        }
+
+        let data = self.data();
+        let mut out = Vec::with_capacity((width * height * 3) as usize);
+        for row in y..y + height {
+            let start = row as usize * self.stride as usize + x as usize * 4;
+            for px in data[start..start + width as usize * 4].chunks_exact(4) {
+                if rgb {
+                    out.extend_from_slice(&[px[2], px[1], px[0]]);
+                } else {
+                    out.extend_from_slice(&px[..3]);
+                }
+            }
+        }
+        Some(out)
     }
+}
 
-    // Find target output
-    let target_output_idx = state.outputs.iter()
-        .position(|o| o.name.as_deref() == Some(output_name))
-        .ok_or_else(|| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("Output '{}' not found", output_name)))?;
+impl Drop for ShmBuffer {
+    fn drop(&mut self) {
+        unsafe { nix::sys::mman::munmap(self.mmap, self.size).ok(); }
+        self.buffer.destroy();
+        self.pool.destroy();
+    }
+}
 
-    // Start capture
-    let frame = state.screencopy_manager.as_ref().unwrap()
-        .capture_output(0, &state.outputs[target_output_idx].output, &qh, ());
+/// Keeps a shm buffer mapped while numpy views into it are alive
+#[pyclass]
+struct FrameLease {
+    _buffer: Arc<ShmBuffer>,
+}
 
-    // Wait for buffer info
-    while state.frame_data.format.is_none() && !state.frame_data.failed {
-        event_queue.blocking_dispatch(&mut state)
-            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Dispatch failed: {}", e)))?;
+/// How long a single dispatch waits for compositor events
+const DISPATCH_TIMEOUT_MS: u16 = 100;
+
+/// Default number of shm buffers per session: one can be held by the caller
+/// while the next frame is copied into the other one
+const DEFAULT_BUFFERS: usize = 2;
+/// Consecutive capture_output_region failures before regions always use full frames
+const MAX_REGION_FAILURES: u32 = 3;
+
+/// Output area in pixels: [x0, x1) x [y0, y1)
+struct Region {
+    name: String,
+    x0: i32,
+    y0: i32,
+    x1: i32,
+    y1: i32,
+}
+
+impl Region {
+    fn width(&self) -> i32 {
+        self.x1 - self.x0
     }
 
-    if state.frame_data.failed {
-        return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("Frame capture failed"));
+    fn height(&self) -> i32 {
+        self.y1 - self.y0
     }
+}
+
+/// Accepts {name: (x0, y0, x1, y1)} or [(name, (x0, y0, x1, y1)), ...]
+fn extract_regions(regions: &Bound<'_, PyAny>) -> PyResult<Vec<Region>> {
+    let items: Vec<(String, Vec<i32>)> = match regions.downcast::<PyDict>() {
+        Ok(dict) => dict.items().extract()?,
+        Err(_) => regions.extract()?,
+    };
 
-    let width = state.frame_data.width;
-    let height = state.frame_data.height;
-    let stride = state.frame_data.stride;
-    let format = state.frame_data.format.unwrap();
-    let size = (stride * height) as usize;
+    items.into_iter()
+        .map(|(name, pos)| match pos[..] {
+            [x0, y0, x1, y1] if x0 >= 0 && y0 >= 0 && x1 > x0 && y1 > y0 => {
+                Ok(Region { name, x0, y0, x1, y1 })
+            }
+            _ => Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                format!("Region '{}' must be (x0, y0, x1, y1) with x1 > x0 >= 0, y1 > y0 >= 0: {:?}", name, pos)
+            )),
+        })
+        .collect()
+}
 
-    // Create shm buffer
-    let fd = create_shm_file(size)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Failed to create shm file: {}", e)))?;
+/// Reusable shm buffers for captures of the same kind
+struct BufferPool {
+    buffers: Vec<Arc<ShmBuffer>>,
+    max_buffers: usize,
+}
 
-    let pool = state.shm.as_ref().unwrap().create_pool(fd.as_fd(), size as i32, &qh, ());
-    let buffer = pool.create_buffer(0, width as i32, height as i32, stride as i32, format, &qh, ());
+impl BufferPool {
+    fn new(max_buffers: usize) -> Self {
+        Self { buffers: Vec::new(), max_buffers: max_buffers.max(1) }
+    }
 
-    // Memory map for reading
-    let mmap = unsafe {
-        nix::sys::mman::mmap(
-            None,
-            std::num::NonZeroUsize::new(size).unwrap(),
-            nix::sys::mman::ProtFlags::PROT_READ | nix::sys::mman::ProtFlags::PROT_WRITE,
-            nix::sys::mman::MapFlags::MAP_SHARED,
-            &fd,
-            0,
-        )
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("mmap failed: {}", e)))?
-    };
+    /// Pick a shm buffer that is not leased to python.
+    /// Buffers are recreated only when the geometry or format changes.
+    fn acquire(
+        &mut self,
+        shm: &wl_shm::WlShm,
+        qh: &QueueHandle<ScreenshotState>,
+        frame: &FrameData,
+    ) -> PyResult<Arc<ShmBuffer>> {
+        // outdated buffers are dropped from the pool, leased ones are unmapped on release
+        self.buffers.retain(|b| b.matches(frame));
+
+        if let Some(buffer) = self.buffers.iter().find(|b| Arc::strong_count(b) == 1) {
+            return Ok(Arc::clone(buffer));
+        }
+        if self.buffers.len() >= self.max_buffers {
+            return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!(
+                "All {} frame buffers are in use, release references to older frames", self.max_buffers
+            )));
+        }
+
+        let buffer = Arc::new(ShmBuffer::new(
+            shm,
+            qh,
+            frame.width,
+            frame.height,
+            frame.stride,
+            frame.format.unwrap(),
+        )?);
+        self.buffers.push(Arc::clone(&buffer));
+        Ok(buffer)
+    }
+
+    /// A capture can be made without waiting for python to release a frame
+    fn available(&self) -> bool {
+        self.buffers.len() < self.max_buffers || self.buffers.iter().any(|b| Arc::strong_count(b) == 1)
+    }
+}
+
+/// Wayland connection with bound globals, kept alive between captures
+pub(crate) struct Session {
+    full_pool: BufferPool,
+    region_pool: BufferPool,
+    // consecutive capture_output_region failures, region capture is off at MAX_REGION_FAILURES
+    region_failures: u32,
+    // pending captures are abandoned when the flag is cleared
+    running: Option<Arc<AtomicBool>>,
+    event_queue: EventQueue<ScreenshotState>,
+    qh: QueueHandle<ScreenshotState>,
+    state: ScreenshotState,
+    output_name: String,
+    _conn: Connection,
+}
+
+impl Session {
+    pub(crate) fn connect(output_name: &str, max_buffers: usize) -> PyResult<Self> {
+        let conn = Connection::connect_to_env()
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Failed to connect to Wayland: {}", e)))?;
+
+        let mut event_queue = conn.new_event_queue();
+        let qh = event_queue.handle();
+        let display = conn.display();
+
+        let mut state = ScreenshotState::new();
+        display.get_registry(&qh, ());
 
-    // Copy frame
-    frame.copy(&buffer);
+        // First roundtrip to get globals
+        event_queue.roundtrip(&mut state)
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Roundtrip failed: {}", e)))?;
+        // Second roundtrip to get output names
+        event_queue.roundtrip(&mut state)
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Roundtrip failed: {}", e)))?;
 
-    // Wait for ready
-    while !state.frame_data.ready && !state.frame_data.failed {
-        event_queue.blocking_dispatch(&mut state)
+        // Check required globals
+        if state.shm.is_none() {
+            return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("wl_shm not available"));
+        }
+        if state.screencopy_manager.is_none() {
+            return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("zwlr_screencopy_manager_v1 not available"));
+        }
+
+        let session = Self {
+            full_pool: BufferPool::new(max_buffers),
+            // region pixels are copied out right away, buffers are never leased
+            region_pool: BufferPool::new(1),
+            region_failures: 0,
+            running: None,
+            event_queue,
+            qh,
+            state,
+            output_name: output_name.to_string(),
+            _conn: conn,
+        };
+        session.find_output()?;
+        Ok(session)
+    }
+
+    fn find_output(&self) -> PyResult<&OutputInfo> {
+        self.state.outputs.iter()
+            .find(|o| o.name.as_deref() == Some(self.output_name.as_str()))
+            .ok_or_else(|| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("Output '{}' not found", self.output_name)))
+    }
+
+    fn output(&mut self) -> PyResult<wl_output::WlOutput> {
+        if self.find_output().is_err() {
+            // output could be re-plugged, pick up new globals and names
+            self.event_queue.roundtrip(&mut self.state)
+                .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Roundtrip failed: {}", e)))?;
+            self.event_queue.roundtrip(&mut self.state)
+                .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Roundtrip failed: {}", e)))?;
+        }
+        Ok(self.find_output()?.output.clone())
+    }
+
+    fn dispatch_until(&mut self, done: fn(&FrameData) -> bool) -> PyResult<()> {
+        while !done(&self.state.frame_data) && !self.state.frame_data.failed {
+            if self.running.as_ref().is_some_and(|r| !r.load(Ordering::SeqCst)) {
+                return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("Capture stopped"));
+            }
+            self.dispatch_timeout()?;
+        }
+        Ok(())
+    }
+
+    /// Dispatch events, waiting at most DISPATCH_TIMEOUT_MS for new ones
+    fn dispatch_timeout(&mut self) -> PyResult<()> {
+        use nix::poll::{poll, PollFd, PollFlags, PollTimeout};
+
+        self.event_queue.flush()
+            .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Flush failed: {}", e)))?;
+
+        if let Some(guard) = self.event_queue.prepare_read() {
+            let mut poll_fds = [PollFd::new(guard.connection_fd(), PollFlags::POLLIN)];
+            let ready = match poll(&mut poll_fds, PollTimeout::from(DISPATCH_TIMEOUT_MS)) {
+                Ok(n) => n,
+                Err(nix::errno::Errno::EINTR) => 0,
+                Err(e) => {
+                    return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Poll failed: {}", e)));
+                }
+            };
+            if ready > 0 {
+                match guard.read() {
+                    Ok(_) => {}
+                    Err(WaylandError::Io(e)) if e.kind() == std::io::ErrorKind::WouldBlock => {}
+                    Err(e) => {
+                        return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Read failed: {}", e)));
+                    }
+                }
+            }
+        }
+
+        self.event_queue.dispatch_pending(&mut self.state)
             .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Dispatch failed: {}", e)))?;
+        Ok(())
     }
 
-    if state.frame_data.failed {
-        unsafe { nix::sys::mman::munmap(mmap, size).ok(); }
-        return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("Frame capture failed"));
+    /// Abandon pending captures when the flag is cleared
+    pub(crate) fn set_running_flag(&mut self, running: Arc<AtomicBool>) {
+        self.running = Some(running);
     }
 
-    // Convert to RGB (from BGRX)
-    let src = unsafe { std::slice::from_raw_parts(mmap.as_ptr() as *const u8, size) };
-    let mut rgb_data = Vec::with_capacity((width * height * 3) as usize);
+    /// Capture the whole output or a logical (x, y, width, height) area of it
+    /// into one of the reusable shm buffers.
+    /// With `with_damage` the compositor waits for changes and reports damaged areas.
+    fn grab_area(&mut self, area: Option<(i32, i32, i32, i32)>, with_damage: bool) -> PyResult<Arc<ShmBuffer>> {
+        let output = self.output()?;
+
+        self.state.frame_data = FrameData::new();
+        let manager = self.state.screencopy_manager.as_ref().unwrap();
+        let frame = match area {
+            Some((x, y, width, height)) => {
+                manager.capture_output_region(0, &output, x, y, width, height, &self.qh, ())
+            }
+            None => manager.capture_output(0, &output, &self.qh, ()),
+        };
 
-    for y in 0..height {
-        let row_start = (y * stride) as usize;
-        for x in 0..width {
-            let pixel_start = row_start + (x * 4) as usize;
-            // XRGB8888/ARGB8888: memory layout is B, G, R, X/A on little-endian
-            rgb_data.push(src[pixel_start + 2]); // R
-            rgb_data.push(src[pixel_start + 1]); // G
-            rgb_data.push(src[pixel_start]);     // B
+        // Wait for buffer info
+        self.dispatch_until(|f| f.format.is_some())?;
+
+        if self.state.frame_data.failed {
+            frame.destroy();
+            return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("Frame capture failed"));
+        }
+
+        let pool = if area.is_some() { &mut self.region_pool } else { &mut self.full_pool };
+        let buffer = match pool.acquire(self.state.shm.as_ref().unwrap(), &self.qh, &self.state.frame_data) {
+            Ok(buffer) => buffer,
+            Err(e) => {
+                frame.destroy();
+                return Err(e);
+            }
+        };
+
+        // Copy frame
+        if with_damage {
+            frame.copy_with_damage(&buffer.buffer);
+        } else {
+            frame.copy(&buffer.buffer);
+        }
+
+        // Wait for ready
+        let ready = self.dispatch_until(|f| f.ready);
+        frame.destroy();
+        ready?;
+
+        if self.state.frame_data.failed {
+            return Err(PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("Frame capture failed"));
+        }
+
+        Ok(buffer)
+    }
+
+    /// Capture a frame into one of the reusable shm buffers
+    pub(crate) fn grab(&mut self) -> PyResult<Arc<ShmBuffer>> {
+        self.grab_area(None, false)
+    }
+
+    /// Wait for the output to change and capture it.
+    /// Returns damaged areas since the previous capture, None if the compositor can't report them.
+    pub(crate) fn grab_damaged(&mut self) -> PyResult<(Arc<ShmBuffer>, Option<Vec<Damage>>)> {
+        // copy_with_damage is available since version 2
+        let supported = self.state.screencopy_manager.as_ref().unwrap().version() >= 2;
+        let buffer = self.grab_area(None, supported)?;
+        let damage = supported.then(|| std::mem::take(&mut self.state.frame_data.damage));
+        Ok((buffer, damage))
+    }
+
+    pub(crate) fn has_free_buffer(&self) -> bool {
+        self.full_pool.available()
+    }
+
+    /// Compositor timestamp of the last captured frame
+    pub(crate) fn timestamp_ns(&self) -> u64 {
+        self.state.frame_data.timestamp_ns
+    }
+
+    fn grab_rgb(&mut self) -> PyResult<(Vec<u8>, u32, u32)> {
+        let buffer = self.grab()?;
+        Ok((buffer.to_rgb(), buffer.width, buffer.height))
+    }
+
+    /// Capture the bounding box of all regions with capture_output_region
+    /// and copy every region out of it. A failed region capture falls back to a full frame
+    /// for that call; region capture is given up after MAX_REGION_FAILURES failures in a row.
+    fn grab_regions(&mut self, regions: &[Region], rgb: bool) -> PyResult<Vec<Vec<u8>>> {
+        if regions.is_empty() {
+            return Ok(Vec::new());
+        }
+
+        if self.region_failures < MAX_REGION_FAILURES {
+            // capture_output_region works in logical coordinates
+            let scale = self.find_output()?.scale.max(1);
+            let x0 = regions.iter().map(|r| r.x0).min().unwrap() / scale;
+            let y0 = regions.iter().map(|r| r.y0).min().unwrap() / scale;
+            let x1 = (regions.iter().map(|r| r.x1).max().unwrap() + scale - 1) / scale;
+            let y1 = (regions.iter().map(|r| r.y1).max().unwrap() + scale - 1) / scale;
+
+            if let Ok(buffer) = self.grab_area(Some((x0, y0, x1 - x0, y1 - y0)), false) {
+                let origin = (x0 * scale, y0 * scale);
+                let crops: Option<Vec<Vec<u8>>> = regions.iter()
+                    .map(|r| buffer.copy_region(r, origin, rgb))
+                    .collect();
+                if let Some(crops) = crops {
+                    self.region_failures = 0;
+                    return Ok(crops);
+                }
+            }
+            self.region_failures += 1;
         }
+
+        let buffer = self.grab()?;
+        regions.iter()
+            .map(|r| buffer.copy_region(r, (0, 0), rgb).ok_or_else(|| {
+                PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                    "Region '{}' is outside of the {}x{} output", r.name, buffer.width, buffer.height
+                ))
+            }))
+            .collect()
     }
+}
+
+fn capture_screenshot_impl(output_name: &str) -> PyResult<(Vec<u8>, u32, u32)> {
+    Session::connect(output_name, 1)?.grab_rgb()
+}
+
+fn pixels_to_array<'py>(py: Python<'py>, pixels: Vec<u8>, width: u32, height: u32) -> PyResult<Bound<'py, PyArray3<u8>>> {
+    let array = Array3::from_shape_vec((height as usize, width as usize, 3), pixels)
+        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Array shape error: {}", e)))?;
+    Ok(PyArray3::from_owned_array_bound(py, array))
+}
 
-    // Cleanup
-    unsafe { nix::sys::mman::munmap(mmap, size).ok(); }
-    buffer.destroy();
-    pool.destroy();
-    frame.destroy();
+/// Read-only numpy view of the shm buffer: (height, width, 4) BGRX with row stride.
+/// The view keeps the buffer leased, so it is not reused while referenced.
+pub(crate) fn buffer_view<'py>(py: Python<'py>, buffer: Arc<ShmBuffer>) -> PyResult<Bound<'py, PyArray3<u8>>> {
+    let shape = (buffer.height as usize, buffer.width as usize, 4)
+        .strides((buffer.stride as usize, 4, 1));
+    let view = unsafe { ArrayView3::from_shape_ptr(shape, buffer.mmap.as_ptr() as *const u8) };
 
-    Ok((rgb_data, width, height))
+    let lease = Bound::new(py, FrameLease { _buffer: Arc::clone(&buffer) })?.into_any();
+    let array = unsafe { PyArray3::borrow_from_array_bound(&view, lease) };
+
+    let kwargs = PyDict::new_bound(py);
+    kwargs.set_item("write", false)?;
+    array.call_method("setflags", (), Some(&kwargs))?;
+    Ok(array)
 }
 
 /// Capture a screenshot from the specified output and return as numpy array
@@ -267,10 +670,7 @@ fn capture_screenshot_impl(output_name: &str) -> PyResult<(Vec<u8>, u32, u32)> {
 #[pyfunction]
 pub fn capture<'py>(py: Python<'py>, output_name: &str) -> PyResult<Bound<'py, PyArray3<u8>>> {
     let (rgb_data, width, height) = capture_screenshot_impl(output_name)?;
-
-    let array = Array3::from_shape_vec((height as usize, width as usize, 3), rgb_data)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyRuntimeError, _>(format!("Array shape error: {}", e)))?;
-    Ok(PyArray3::from_owned_array_bound(py, array))
+    pixels_to_array(py, rgb_data, width, height)
 }
 
 /// Capture a screenshot and return raw bytes along with dimensions
@@ -280,6 +680,90 @@ pub fn capture_raw(output_name: &str) -> PyResult<(Vec<u8>, u32, u32)> {
     capture_screenshot_impl(output_name)
 }
 
+/// Persistent capturer for a single output.
+/// Keeps the Wayland connection, bound globals and shm buffers alive across frames.
+#[pyclass]
+pub struct Capturer {
+    session: Session,
+}
+
+#[pymethods]
+impl Capturer {
+    #[new]
+    #[pyo3(signature = (output_name, buffers = DEFAULT_BUFFERS))]
+    fn new(output_name: &str, buffers: usize) -> PyResult<Self> {
+        Ok(Self { session: Session::connect(output_name, buffers)? })
+    }
+
+    #[getter]
+    fn output_name(&self) -> String {
+        self.session.output_name.clone()
+    }
+
+    /// Capture a screenshot as numpy array with shape (height, width, 3) in RGB format
+    fn capture<'py>(&mut self, py: Python<'py>) -> PyResult<Bound<'py, PyArray3<u8>>> {
+        let session = &mut self.session;
+        let (rgb_data, width, height) = py.allow_threads(|| session.grab_rgb())?;
+        pixels_to_array(py, rgb_data, width, height)
+    }
+
+    /// Capture a screenshot and return raw bytes along with dimensions
+    fn capture_raw(&mut self, py: Python<'_>) -> PyResult<(Vec<u8>, u32, u32)> {
+        let session = &mut self.session;
+        py.allow_threads(|| session.grab_rgb())
+    }
+
+    /// Capture without copying: read-only view of the shm buffer, shape (height, width, 4) BGRX.
+    /// The buffer is not reused while the view (or any slice of it) is alive,
+    /// capture fails when all `buffers` are still referenced.
+    fn capture_view<'py>(&mut self, py: Python<'py>) -> PyResult<Bound<'py, PyArray3<u8>>> {
+        let session = &mut self.session;
+        let buffer = py.allow_threads(|| session.grab())?;
+        buffer_view(py, buffer)
+    }
+
+    /// Capture continuously on a native thread into a ring of `buffers` shm buffers.
+    /// Iterating the stream yields the newest frame, see FrameStream.
+    /// With `damage` frames are captured only when the output changes;
+    /// `regions` [(x0, y0, x1, y1), ...] enables damage and skips frames that don't change them.
+    /// `seconds` ends the iteration after the given time, also when no frame arrives.
+    #[pyo3(signature = (fps = None, buffers = DEFAULT_RING, damage = false, regions = None, seconds = None))]
+    fn stream(
+        &self,
+        fps: Option<f64>,
+        buffers: usize,
+        damage: bool,
+        regions: Option<Vec<Vec<i32>>>,
+        seconds: Option<f64>,
+    ) -> PyResult<FrameStream> {
+        let damage = damage || regions.is_some();
+        let regions = extract_boxes(regions.unwrap_or_default())?;
+        FrameStream::start(&self.session.output_name, fps, buffers, damage, regions, seconds)
+    }
+
+    /// Capture only the given regions: {name: (x0, y0, x1, y1)} in output pixels.
+    /// Uses capture_output_region when the compositor supports it, full frame otherwise.
+    /// Returns {name: numpy array (height, width, 3)} in BGR (or RGB) format.
+    #[pyo3(signature = (regions, rgb = false))]
+    fn capture_regions<'py>(
+        &mut self,
+        py: Python<'py>,
+        regions: &Bound<'py, PyAny>,
+        rgb: bool,
+    ) -> PyResult<Bound<'py, PyDict>> {
+        let regions = extract_regions(regions)?;
+        let session = &mut self.session;
+        let crops = py.allow_threads(|| session.grab_regions(&regions, rgb))?;
+
+        let out = PyDict::new_bound(py);
+        for (region, pixels) in regions.iter().zip(crops) {
+            let array = pixels_to_array(py, pixels, region.width() as u32, region.height() as u32)?;
+            out.set_item(&region.name, array)?;
+        }
+        Ok(out)
+    }
+}
+
 /// List available outputs
 #[pyfunction]
 pub fn list_outputs() -> PyResult<Vec<String>> {
@@ -0,0 +1,301 @@
+//! Continuous capture: a native thread copies frames into a ring of shm buffers,
+//! the consumer always gets the newest one
+
+use numpy::PyArray3;
+use parking_lot::{Condvar, Mutex};
+use pyo3::prelude::*;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::Arc;
+use std::thread::{self, JoinHandle};
+use std::time::{Duration, Instant};
+
+use crate::screenshot::{buffer_view, Damage, Session, ShmBuffer};
+
+/// Default ring size: the newest frame, the frame held by the consumer and the one being copied
+pub const DEFAULT_RING: usize = 3;
+
+/// How often a waiting consumer checks for python signals
+const POLL_INTERVAL: Duration = Duration::from_millis(100);
+
+/// Pending damage is merged into a bounding box above this many areas
+const MAX_DAMAGE: usize = 64;
+
+/// Area of interest in output pixels: (x0, y0, x1, y1)
+type RegionBox = (i32, i32, i32, i32);
+
+/// Accepts [(x0, y0, x1, y1), ...]
+pub fn extract_boxes(boxes: Vec<Vec<i32>>) -> PyResult<Vec<RegionBox>> {
+    boxes.into_iter()
+        .map(|pos| match pos[..] {
+            [x0, y0, x1, y1] if x1 > x0 && y1 > y0 => Ok((x0, y0, x1, y1)),
+            _ => Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                format!("Region must be (x0, y0, x1, y1) with x1 > x0, y1 > y0: {:?}", pos)
+            )),
+        })
+        .collect()
+}
+
+fn intersects(damage: &Damage, region: &RegionBox) -> bool {
+    let (x, y, width, height) = *damage;
+    let (x0, y0, x1, y1) = *region;
+    x < x1 && x + width > x0 && y < y1 && y + height > y0
+}
+
+fn bounding_box(damage: &[Damage]) -> Damage {
+    let x0 = damage.iter().map(|d| d.0).min().unwrap_or(0);
+    let y0 = damage.iter().map(|d| d.1).min().unwrap_or(0);
+    let x1 = damage.iter().map(|d| d.0 + d.2).max().unwrap_or(0);
+    let y1 = damage.iter().map(|d| d.1 + d.3).max().unwrap_or(0);
+    (x0, y0, x1 - x0, y1 - y0)
+}
+
+/// Newest captured frame
+#[derive(Clone)]
+struct Published {
+    buffer: Arc<ShmBuffer>,
+    seq: u64,
+    timestamp_ns: u64,
+    // None when damage is not tracked
+    damage: Option<Vec<Damage>>,
+}
+
+/// Shared data between the capture thread and the consumer
+struct Shared {
+    latest: Mutex<Option<Published>>,
+    ready: Condvar,
+    running: Arc<AtomicBool>,
+    error: Mutex<Option<PyErr>>,
+    regions: Mutex<Vec<RegionBox>>,
+    skipped: AtomicU64,
+}
+
+impl Shared {
+    /// Wait for a frame newer than `seq`, returns None on timeout or stop
+    fn wait_newer(&self, seq: u64, timeout: Duration) -> Option<Published> {
+        let mut latest = self.latest.lock();
+        loop {
+            if let Some(p) = latest.as_ref().filter(|p| p.seq > seq) {
+                return Some(p.clone());
+            }
+            if !self.running.load(Ordering::SeqCst) {
+                return None;
+            }
+            if self.ready.wait_for(&mut latest, timeout).timed_out() {
+                return None;
+            }
+        }
+    }
+}
+
+/// Iterator over the newest frames of an output.
+/// Yields (read-only BGRX view, compositor timestamp ns, frames dropped since the previous one,
+/// damaged areas [(x, y, width, height), ...] since the previous frame or None when not tracked).
+/// A frame is not overwritten while it is referenced from python.
+#[pyclass]
+pub struct FrameStream {
+    shared: Arc<Shared>,
+    thread_handle: Option<JoinHandle<()>>,
+    last_seq: u64,
+    dropped: u64,
+    // iteration ends here even when no frame arrives, e.g. static screen with damage tracking
+    deadline: Option<Instant>,
+}
+
+impl FrameStream {
+    pub fn start(
+        output_name: &str,
+        fps: Option<f64>,
+        buffers: usize,
+        damage: bool,
+        regions: Vec<RegionBox>,
+        seconds: Option<f64>,
+    ) -> PyResult<Self> {
+        // separate connection, the capture thread owns it
+        let mut session = Session::connect(output_name, buffers.max(2))?;
+        let interval = fps.filter(|fps| *fps > 0.0).map(|fps| Duration::from_secs_f64(1.0 / fps));
+
+        let shared = Arc::new(Shared {
+            latest: Mutex::new(None),
+            ready: Condvar::new(),
+            running: Arc::new(AtomicBool::new(true)),
+            error: Mutex::new(None),
+            regions: Mutex::new(regions),
+            skipped: AtomicU64::new(0),
+        });
+        // don't wait for damage forever on stop
+        session.set_running_flag(Arc::clone(&shared.running));
+
+        let shared_clone = Arc::clone(&shared);
+        let thread_handle = thread::spawn(move || {
+            run_capture_loop(session, shared_clone, interval, damage);
+        });
+
+        Ok(Self {
+            shared,
+            thread_handle: Some(thread_handle),
+            last_seq: 0,
+            dropped: 0,
+            deadline: seconds.map(|seconds| Instant::now() + Duration::from_secs_f64(seconds.max(0.0))),
+        })
+    }
+}
+
+#[pymethods]
+impl FrameStream {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    #[allow(clippy::type_complexity)]
+    fn __next__<'py>(
+        &mut self,
+        py: Python<'py>,
+    ) -> PyResult<Option<(Bound<'py, PyArray3<u8>>, u64, u64, Option<Vec<Damage>>)>> {
+        loop {
+            let left = match self.deadline {
+                Some(deadline) => match deadline.checked_duration_since(Instant::now()) {
+                    Some(left) if !left.is_zero() => left.min(POLL_INTERVAL),
+                    _ => return Ok(None),
+                },
+                None => POLL_INTERVAL,
+            };
+            let shared = Arc::clone(&self.shared);
+            let last_seq = self.last_seq;
+            if let Some(frame) = py.allow_threads(move || shared.wait_newer(last_seq, left)) {
+                let dropped = frame.seq - self.last_seq - 1;
+                self.last_seq = frame.seq;
+                self.dropped += dropped;
+                let view = buffer_view(py, frame.buffer)?;
+                return Ok(Some((view, frame.timestamp_ns, dropped, frame.damage)));
+            }
+
+            if let Some(err) = self.shared.error.lock().take() {
+                return Err(err);
+            }
+            if !self.shared.running.load(Ordering::SeqCst) {
+                return Ok(None);
+            }
+            py.check_signals()?;
+        }
+    }
+
+    /// Total frames captured but never delivered
+    #[getter]
+    fn dropped(&self) -> u64 {
+        self.dropped
+    }
+
+    /// Total frames skipped because nothing changed in the watched regions
+    #[getter]
+    fn skipped(&self) -> u64 {
+        self.shared.skipped.load(Ordering::SeqCst)
+    }
+
+    /// Replace watched regions [(x0, y0, x1, y1), ...], empty list delivers every damaged frame.
+    /// Has effect only for streams with damage tracking.
+    fn watch(&self, regions: Vec<Vec<i32>>) -> PyResult<()> {
+        *self.shared.regions.lock() = extract_boxes(regions)?;
+        Ok(())
+    }
+
+    #[getter]
+    fn running(&self) -> bool {
+        self.shared.running.load(Ordering::SeqCst)
+    }
+
+    /// Stop the capture thread
+    fn stop(&mut self, py: Python<'_>) -> PyResult<()> {
+        self.shared.running.store(false, Ordering::SeqCst);
+
+        if let Some(handle) = self.thread_handle.take() {
+            py.allow_threads(|| handle.join()).map_err(|_|
+                PyErr::new::<pyo3::exceptions::PyRuntimeError, _>("Thread join failed")
+            )?;
+        }
+
+        Ok(())
+    }
+}
+
+impl Drop for FrameStream {
+    fn drop(&mut self) {
+        self.shared.running.store(false, Ordering::SeqCst);
+        if let Some(handle) = self.thread_handle.take() {
+            let _ = handle.join();
+        }
+    }
+}
+
+/// Capture frames until stopped, publish every frame as the newest one.
+/// With damage tracking frames that don't change watched regions are skipped,
+/// their damage is passed on with the next published frame.
+fn run_capture_loop(mut session: Session, shared: Arc<Shared>, interval: Option<Duration>, damage: bool) {
+    let mut seq = 0;
+    let mut next_frame = Instant::now();
+    let mut pending: Vec<Damage> = Vec::new();
+
+    while shared.running.load(Ordering::SeqCst) {
+        if let Some(interval) = interval {
+            let now = Instant::now();
+            if now < next_frame {
+                thread::sleep(next_frame - now);
+            }
+            next_frame = next_frame.max(now) + interval;
+        }
+
+        if !session.has_free_buffer() {
+            // consumer holds every frame of the ring
+            thread::sleep(Duration::from_millis(1));
+            continue;
+        }
+
+        let captured = if damage {
+            session.grab_damaged()
+        } else {
+            session.grab().map(|buffer| (buffer, None))
+        };
+
+        match captured {
+            Ok((buffer, frame_damage)) => {
+                let frame_damage = match frame_damage {
+                    Some(rects) => {
+                        pending.extend(rects);
+                        if pending.len() > MAX_DAMAGE {
+                            pending = vec![bounding_box(&pending)];
+                        }
+
+                        let regions = shared.regions.lock();
+                        let changed = regions.is_empty()
+                            || pending.iter().any(|d| regions.iter().any(|r| intersects(d, r)));
+                        drop(regions);
+
+                        // the first frame is always delivered
+                        if seq > 0 && !changed {
+                            shared.skipped.fetch_add(1, Ordering::SeqCst);
+                            continue;
+                        }
+                        Some(std::mem::take(&mut pending))
+                    }
+                    None => None,
+                };
+
+                seq += 1;
+                *shared.latest.lock() = Some(Published {
+                    buffer,
+                    seq,
+                    timestamp_ns: session.timestamp_ns(),
+                    damage: frame_damage,
+                });
+                shared.ready.notify_all();
+            }
+            Err(_) if !shared.running.load(Ordering::SeqCst) => break,
+            Err(e) => {
+                *shared.error.lock() = Some(e);
+                break;
+            }
+        }
+    }
+
+    shared.running.store(false, Ordering::SeqCst);
+    shared.ready.notify_all();
+}